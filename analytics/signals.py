@@ -0,0 +1,22 @@
+"""
+Signal handlers for analytics app.
+"""
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from music_discovery_backend import caching
+from users.models import UserProfile
+from .models import UserActivity
+
+# Version stamp of the data behind /analytics/trends/
+TRENDS_VERSION = 'analytics:trends'
+
+
+@receiver(post_save, sender=UserActivity)
+@receiver(post_delete, sender=UserActivity)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def bump_trends_version(sender, **kwargs):
+    # After commit, so no reader pairs the new stamp with old data
+    transaction.on_commit(partial(caching.bump_version, TRENDS_VERSION))
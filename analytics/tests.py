@@ -1,3 +1,92 @@
+"""
+Tests for analytics app.
+"""
+from django.core.cache import cache
 from django.test import TestCase
+from users.models import User
+from .models import UserActivity
 
-# Create your tests here.
+
+class TrendsConditionalGetTest(TestCase):
+    """Test ETag handling on the trends endpoint."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='trends', email='trends@example.com')
+    
+    def record_play(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            UserActivity.objects.create(
+                user=self.user, track_id='t1', track_name='Song', artist_name='Artist', action='play'
+            )
+    
+    def test_unchanged_trends_return_304_without_queries(self):
+        """Test a matching If-None-Match skips the trend queries."""
+        self.record_play()
+        response = self.client.get('/api/analytics/trends/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(response.json()['popular_tracks'][0]['play_count'], 1)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/analytics/trends/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_new_activity_changes_etag(self):
+        """Test recording activity invalidates clients' copies."""
+        etag = self.client.get('/api/analytics/trends/')['ETag']
+        self.record_play()
+        response = self.client.get('/api/analytics/trends/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ActivityCursorPaginationTest(TestCase):
+    """Test keyset pagination of the activity listing."""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create(username=f'pager{i}', email=f'pager{i}@example.com') for i in range(2)
+        ]
+        UserActivity.objects.bulk_create([
+            UserActivity(user=self.users[i % 2], track_id=f't{i}', track_name='Song', artist_name='Artist', action='play')
+            for i in range(45)
+        ])
+    
+    def collect(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.json())
+            ids.extend(item['id'] for item in response.json()['results'])
+            url, pages = response.json()['next'], pages + 1
+        return ids, pages
+    
+    def test_pages_cover_every_activity_once(self):
+        """Test cursors walk the table newest first without COUNT(*)."""
+        with self.assertNumQueries(1):
+            self.client.get('/api/analytics/activity/')
+        ids, pages = self.collect('/api/analytics/activity/')
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, list(UserActivity.objects.values_list('id', flat=True)))
+    
+    def test_filter_by_user(self):
+        """Test ?user= limits the listing to one user's activity."""
+        ids, _ = self.collect(f'/api/analytics/activity/?user={self.users[1].id}')
+        self.assertEqual(len(ids), 22)
+        self.assertEqual(set(UserActivity.objects.filter(id__in=ids).values_list('user', flat=True)), {self.users[1].id})
+        response = self.client.get('/api/analytics/activity/?user=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('user', response.json())
+
+    def test_sparse_fields(self):
+        """Test ?fields= returns only the requested keys, paged by cursor."""
+        body = self.client.get('/api/analytics/activity/?fields=id,user,timestamp').json()
+        self.assertEqual(set(body['results'][0]), {'id', 'user', 'timestamp'})
+        self.assertIn(body['results'][0]['user'], {user.id for user in self.users})
+        full = self.client.get('/api/analytics/activity/').json()['results'][0]
+        self.assertEqual(body['results'][0]['timestamp'], full['timestamp'])
+        
+        ids, pages = self.collect('/api/analytics/activity/?exclude=metadata,track_name')
+        self.assertEqual((len(ids), pages), (45, 3))
@@ -4,10 +4,17 @@ Views for analytics app.
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
 from django.db.models import Count, Q
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from music_discovery_backend import caching
+from music_discovery_backend.pagination import UserScopedListMixin
+from music_discovery_backend.sparse_fields import SparseFieldsMixin
 from .models import UserActivity
+from .signals import TRENDS_VERSION
 from .serializers import (
     UserActivitySerializer,
     ActivityCreateSerializer,
@@ -16,20 +23,21 @@ from .serializers import (
     UserEngagementSerializer
 )
 from users.models import User
-from recommendations.models import Recommendation
+from recommendations.models import Recommendation, RecommendationState
 
 
 @method_decorator(ratelimit(key='ip', rate='20/m', method='POST'), name='create')
-class UserActivityViewSet(viewsets.ModelViewSet):
+class UserActivityViewSet(SparseFieldsMixin, UserScopedListMixin, viewsets.ModelViewSet):
     """
     ViewSet for user activity tracking.
     
     Endpoints:
     - POST /activity/ - Record user activity
-    - GET /activity/ - List activities
+    - GET /activity/ - List activities (?user=<id> for one user's)
     """
     queryset = UserActivity.objects.all()
     serializer_class = UserActivitySerializer
+    newest_first = 'timestamp'
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -41,6 +49,8 @@ class UserActivityViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         activity = serializer.save()
+        RecommendationState.mark_dirty(activity.user_id)
+        RecommendationState.mark_active(activity.user_id)
         
         response_serializer = UserActivitySerializer(activity)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -89,13 +99,23 @@ def analytics_summary(request):
     return Response(data)
 
 
+def trends_etag(request):
+    return caching.version(TRENDS_VERSION)
+
+
+@cache_control(public=True, max_age=settings.ANALYTICS_TRENDS_MAX_AGE)
 @api_view(['GET'])
 @ratelimit(key='ip', rate='30/m', method='GET')
+@condition(etag_func=trends_etag)
 def analytics_trends(request):
     """
     GET /analytics/trends/
     
     Return trending genres and artists across all users.
+    
+    Responses carry an ETag from the trends version stamp, which changes
+    whenever an activity or profile is saved or deleted; a matching
+    If-None-Match gets a 304 without running any of the queries below.
     """
     # Get trending artists from activities
     trending_artists_data = UserActivity.objects.values('artist_name') \
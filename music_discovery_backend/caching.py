@@ -0,0 +1,106 @@
+"""
+Stampede-protected cache reads shared by the apps' cached read paths.
+
+Entries are stored as an envelope holding the value and a logical expiry.
+The cache itself keeps them CACHE_STALE_GRACE seconds longer, so once an
+entry is logically expired exactly one caller (holding a short rebuild lock)
+recomputes it while everyone else keeps serving the stale value. When there
+is no entry at all, callers that lose the lock wait briefly for the winner's
+result instead of all hitting the database.
+
+Version stamps (version()/bump_version()) give read paths a cheap value to
+derive ETags from: writers bump the stamp, readers compare it.
+"""
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+FRESH = 'fresh'
+STALE = 'stale'
+BUILT = 'built'
+
+
+def read_entry(key):
+    """Return the raw envelope for key, or None."""
+    entry = cache.get(key)
+    # Values written before the key moved to envelopes count as missing
+    if not isinstance(entry, dict) or 'expires_at' not in entry:
+        return None
+    return entry
+
+
+def write_entry(key, value, ttl, **meta):
+    """
+    Store value for ttl seconds (plus the stale grace period).
+
+    Extra keyword arguments are kept in the envelope for the caller.
+    """
+    entry = {'value': value, 'expires_at': time.time() + ttl, **meta}
+    cache.set(key, entry, ttl + settings.CACHE_STALE_GRACE)
+    return entry
+
+
+def _lock_key(key):
+    return f'{key}:rebuild_lock'
+
+
+def get_or_build(key, build, ttl, **meta):
+    """
+    Return (value, state, entry) for key, calling build() at most once
+    across concurrent callers when the entry is missing or expired.
+
+    state is FRESH for a valid entry, STALE when an expired entry was
+    served while another caller rebuilds it, and BUILT when this caller
+    computed the value.
+    """
+    entry = read_entry(key)
+    if entry is not None and entry['expires_at'] > time.time():
+        return entry['value'], FRESH, entry
+
+    lock_key = _lock_key(key)
+    if cache.add(lock_key, 1, settings.CACHE_REBUILD_LOCK_TTL):
+        try:
+            entry = write_entry(key, build(), ttl, **meta)
+            return entry['value'], BUILT, entry
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry['value'], STALE, entry
+
+    # Nothing to serve yet: give the rebuilding caller a moment
+    deadline = time.monotonic() + settings.CACHE_REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_REBUILD_POLL_INTERVAL)
+        entry = read_entry(key)
+        if entry is not None:
+            return entry['value'], FRESH, entry
+        if not cache.get(lock_key):
+            break
+
+    entry = write_entry(key, build(), ttl, **meta)
+    return entry['value'], BUILT, entry
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def version(name):
+    """
+    Current version stamp for name.
+
+    A missing stamp (never bumped, or evicted) is replaced by a new one, so
+    losing it can only invalidate, never revive, an old stamp.
+    """
+    key = _version_key(name)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def bump_version(name):
+    cache.set(_version_key(name), uuid.uuid4().hex, None)
@@ -0,0 +1,35 @@
+"""
+Keyset pagination and per-user filtering for list endpoints.
+
+Viewsets mixing in UserScopedListMixin name their timestamp column in
+``newest_first``. Lists are cursor-paginated on it, newest first, so pages
+cost neither a COUNT(*) nor an OFFSET scan, and ``?user=<id>`` narrows the
+list to one user, served by the (user, -<column>) index.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+
+class NewestFirstCursorPagination(CursorPagination):
+    """Cursor pagination ordered by the view's newest_first column, descending."""
+
+    def get_ordering(self, request, queryset, view):
+        return (f'-{view.newest_first}',)
+
+
+class UserScopedListMixin:
+    """Newest-first keyset pagination plus the ?user=<id> filter."""
+    newest_first = None
+    pagination_class = NewestFirstCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user_id = self.request.query_params.get('user')
+        if user_id is not None:
+            try:
+                user_id = serializers.IntegerField(min_value=1).run_validation(user_id)
+            except ValidationError as e:
+                raise ValidationError({'user': e.detail})
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
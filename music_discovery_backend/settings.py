@@ -149,7 +149,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'music_discovery_backend.renderers.ORJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -187,10 +187,11 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+RECOMMENDATION_SCHEDULER_TICK = 300  # seconds between tiered refresh scheduler runs
 CELERY_BEAT_SCHEDULE = {
-    'refresh-all-user-recommendations': {
-        'task': 'recommendations.tasks.refresh_all_user_recommendations',
-        'schedule': 3600.0,  # Every hour
+    'schedule-recommendation-refreshes': {
+        'task': 'recommendations.tasks.schedule_recommendation_refreshes',
+        'schedule': float(RECOMMENDATION_SCHEDULER_TICK),
     },
 }
 
@@ -199,8 +200,115 @@ SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID', '')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET', '')
 SPOTIFY_REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI', 'http://localhost:8000/callback')
 
+# Point these at `manage.py run_fake_spotify` to work offline
+SPOTIFY_API_BASE_URL = os.getenv('SPOTIFY_API_BASE_URL', 'https://api.spotify.com/v1')
+SPOTIFY_AUTH_URL = os.getenv('SPOTIFY_AUTH_URL', 'https://accounts.spotify.com/api/token')
+
+# Spotify access token (held in-process, renewed before expiry), seconds
+SPOTIFY_TOKEN_REFRESH_AHEAD = 300
+SPOTIFY_TOKEN_EXPIRY_MARGIN = 30
+SPOTIFY_TOKEN_LOCK_TTL = 15
+# Backoff between failed background token renewals (seconds, doubling)
+SPOTIFY_TOKEN_RETRY_BACKOFF = 5
+SPOTIFY_TOKEN_RETRY_MAX_BACKOFF = 120
+
+# Spotify HTTP client (one pooled keep-alive session per process)
+SPOTIFY_POOL_SIZE = int(os.getenv('SPOTIFY_POOL_SIZE', '20'))
+SPOTIFY_CONNECT_TIMEOUT = float(os.getenv('SPOTIFY_CONNECT_TIMEOUT', '3.05'))
+SPOTIFY_READ_TIMEOUT = float(os.getenv('SPOTIFY_READ_TIMEOUT', '10'))
+SPOTIFY_MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', '3'))
+SPOTIFY_RETRY_BACKOFF = float(os.getenv('SPOTIFY_RETRY_BACKOFF', '0.5'))
+SPOTIFY_MAX_RETRY_AFTER = int(os.getenv('SPOTIFY_MAX_RETRY_AFTER', '30'))  # seconds
+# Connection pool of the asyncio client (one per event loop)
+SPOTIFY_ASYNC_POOL_SIZE = int(os.getenv('SPOTIFY_ASYNC_POOL_SIZE', '100'))
+
+# Concurrent fan-out inside SpotifyService.get_recommendations
+SPOTIFY_FANOUT_WORKERS = int(os.getenv('SPOTIFY_FANOUT_WORKERS', '8'))
+SPOTIFY_RECOMMENDATIONS_DEADLINE = float(os.getenv('SPOTIFY_RECOMMENDATIONS_DEADLINE', '15'))  # seconds per lookup, once running
+
+# Global Spotify quota shared by all workers (token bucket in Redis)
+SPOTIFY_QUOTA_ENABLED = os.getenv('SPOTIFY_QUOTA_ENABLED', 'True') == 'True'
+SPOTIFY_QUOTA_RATE = float(os.getenv('SPOTIFY_QUOTA_RATE', '8'))  # requests per second
+SPOTIFY_QUOTA_BURST = int(os.getenv('SPOTIFY_QUOTA_BURST', '20'))
+SPOTIFY_QUOTA_INTERACTIVE_RESERVE = int(os.getenv('SPOTIFY_QUOTA_INTERACTIVE_RESERVE', '5'))
+SPOTIFY_QUOTA_WAIT_TIMEOUTS = {  # max seconds a request waits for quota
+    'interactive': 5,
+    'background': 60,
+}
+SPOTIFY_QUOTA_METRICS_FLUSH_INTERVAL = 10  # seconds between writes of each process's quota metrics
+
+# Spotify circuit breaker (state shared through Redis)
+SPOTIFY_BREAKER_WINDOW_SECONDS = 60
+SPOTIFY_BREAKER_BUCKET_SECONDS = 10
+SPOTIFY_BREAKER_MIN_CALLS = 20
+SPOTIFY_BREAKER_FAILURE_RATE = 0.5
+SPOTIFY_BREAKER_OPEN_SECONDS = 30
+SPOTIFY_BREAKER_PROBE_TIMEOUT = 15
+SPOTIFY_BREAKER_STATE_TTL = 1  # seconds each process trusts its last read
+
+# Spotify entity cache (in-process LRU in front of Redis), TTLs in seconds
+SPOTIFY_CACHE_TTLS = {
+    'artist': 86400,
+    'track': 86400,
+    'top_tracks': 21600,
+    'search_artists': 86400,
+    'search_tracks': 3600,
+    # Candidate lists shared by every user with the same seeds
+    'recommendations': int(os.getenv('RECOMMENDATION_SEED_CACHE_TTL', '900')),
+}
+SPOTIFY_DEFAULT_CACHE_TTL = 3600
+SPOTIFY_NEGATIVE_CACHE_TTL = 300
+
+# Catalog rows (artists, albums, tracks) refreshed more recently than this
+# many seconds are not rewritten when they show up in another fetch
+CATALOG_REFRESH_INTERVAL = int(os.getenv('CATALOG_REFRESH_INTERVAL', '86400'))
+SPOTIFY_LOCAL_CACHE_SIZE = int(os.getenv('SPOTIFY_LOCAL_CACHE_SIZE', '2048'))
+SPOTIFY_LOCAL_CACHE_TTL = 300
+
+# Cross-worker coalescing of identical in-flight Spotify requests (seconds)
+SPOTIFY_SINGLEFLIGHT_WAIT = 10
+SPOTIFY_SINGLEFLIGHT_LOCK_TTL = 30
+SPOTIFY_SINGLEFLIGHT_RESULT_TTL = 5
+SPOTIFY_SINGLEFLIGHT_POLL_INTERVAL = 0.05
+
+# Stampede protection for cached read paths (music_discovery_backend.caching)
+CACHE_STALE_GRACE = 300  # seconds an expired entry may be served while rebuilt
+CACHE_REBUILD_LOCK_TTL = 10
+CACHE_REBUILD_WAIT = 2  # seconds a caller waits for another's first build
+CACHE_REBUILD_POLL_INTERVAL = 0.05
+
 # Recommendation Cache TTL (in seconds)
 RECOMMENDATION_CACHE_TTL = 3600  # 1 hour
+# Reads in the last fraction of an entry's lifetime rebuild it in the background
+RECOMMENDATION_REFRESH_AHEAD_ENABLED = os.getenv('RECOMMENDATION_REFRESH_AHEAD_ENABLED', 'True') == 'True'
+RECOMMENDATION_REFRESH_AHEAD_FACTOR = float(os.getenv('RECOMMENDATION_REFRESH_AHEAD_FACTOR', '0.25'))
+
+# Refresh sweeps (each scheduler tick's users, or a manual full refresh) are
+# queued in batches with a cap on unfinished tasks
+RECOMMENDATION_SWEEP_BATCH_SIZE = int(os.getenv('RECOMMENDATION_SWEEP_BATCH_SIZE', '500'))
+RECOMMENDATION_SWEEP_MAX_IN_FLIGHT = int(os.getenv('RECOMMENDATION_SWEEP_MAX_IN_FLIGHT', '2000'))
+RECOMMENDATION_SWEEP_POLL_INTERVAL = 10  # seconds between checks while at the cap
+RECOMMENDATION_SWEEP_STALL_TIMEOUT = 600  # seconds without progress before a sweep is resumed
+RECOMMENDATION_SWEEP_STATE_TTL = 86400
+
+# Tiered refresh scheduling: users are tiered by their last activity or
+# recommendation read (newest tier first; active_within None matches the rest)
+# and each tier is refreshed every `interval` seconds, spread across ticks
+RECOMMENDATION_REFRESH_TIERS = [
+    {'name': 'hot', 'active_within': 86400, 'interval': 1800},
+    {'name': 'warm', 'active_within': 7 * 86400, 'interval': 6 * 3600},
+    {'name': 'dormant', 'active_within': None, 'interval': 86400},
+]
+RECOMMENDATION_QUEUED_TIMEOUT = 3600  # seconds before a queued, unfinished refresh is queued again
+RECOMMENDATION_ACTIVITY_RESOLUTION = 600  # seconds; last_active_at is written at most this often
 
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
+
+# Cached answers to "does user N exist?" for read paths (users.existence);
+# kept current on user create/delete, so these only bound memory use
+USER_EXISTENCE_TTL = 86400
+USER_EXISTENCE_NEGATIVE_TTL = 300
+
+# Seconds shared caches (nginx) may serve /analytics/trends/ without revalidating
+ANALYTICS_TRENDS_MAX_AGE = int(os.getenv('ANALYTICS_TRENDS_MAX_AGE', '60'))
@@ -0,0 +1,102 @@
+"""
+Sparse fieldsets for list endpoints.
+
+Viewsets mixing in SparseFieldsMixin accept ``?fields=a,b`` (only these) or
+``?exclude=a,b`` (all but these) on list requests. When every requested
+field maps to a model column, the queryset is narrowed with .values() and
+rows are serialized by each serializer field's to_representation directly,
+skipping model instances and the ModelSerializer machinery. Requests that
+include nested or computed fields are served by the regular serializer with
+the other fields dropped.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import RelatedField
+from rest_framework.response import Response
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsMixin:
+    """List support for ?fields= and ?exclude=."""
+
+    def get_sparse_fields(self, serializer):
+        """Requested field names in serializer order, or None for all."""
+        fields = self.request.query_params.get('fields')
+        exclude = self.request.query_params.get('exclude')
+        if fields is None and exclude is None:
+            return None
+
+        available = [name for name, field in serializer.fields.items() if not field.write_only]
+        param, requested = ('fields', _split(fields)) if fields is not None else ('exclude', _split(exclude))
+        unknown = sorted(set(requested) - set(available))
+        if unknown:
+            raise ValidationError({param: [f"Unknown field(s): {', '.join(unknown)}"]})
+        if param == 'fields':
+            selected = [name for name in available if name in requested]
+        else:
+            selected = [name for name in available if name not in requested]
+        if not selected:
+            raise ValidationError({param: ["No fields selected"]})
+        return selected
+
+    def _column(self, field):
+        """Model column behind a serializer field, or None if it has none."""
+        if isinstance(field, serializers.BaseSerializer) or '.' in field.source:
+            return None
+        try:
+            model_field = self.get_queryset().model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        return field.source if model_field.concrete and not model_field.many_to_many else None
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        names = self.get_sparse_fields(serializer)
+        if names is None:
+            return super().list(request, *args, **kwargs)
+
+        fields = {name: serializer.fields[name] for name in names}
+        columns = {name: self._column(field) for name, field in fields.items()}
+        queryset = self.filter_queryset(self.get_queryset())
+        if None in columns.values():
+            return self._list_trimmed(queryset, names)
+
+        # Cursor pagination reads its position from the ordering column
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        ordering = get_ordering(request, queryset, self) if get_ordering else []
+        queryset = queryset.prefetch_related(None).values(
+            *set(columns.values()) | {key.lstrip('-') for key in ordering}
+        )
+
+        # Related fields get the raw primary key from .values()
+        converters = [
+            (name, columns[name], None if isinstance(field, RelatedField) else field.to_representation)
+            for name, field in fields.items()
+        ]
+
+        def represent(row):
+            item = {}
+            for name, column, convert in converters:
+                value = row[column]
+                item[name] = value if value is None or convert is None else convert(value)
+            return item
+
+        page = self.paginate_queryset(queryset)
+        data = [represent(row) for row in (page if page is not None else queryset)]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def _list_trimmed(self, queryset, names):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page if page is not None else queryset, many=True)
+        for name in list(serializer.child.fields):
+            if name not in names:
+                serializer.child.fields.pop(name)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
@@ -2,7 +2,7 @@
 Admin configuration for recommendations app.
 """
 from django.contrib import admin
-from .models import Recommendation, RecommendationLog
+from .models import Recommendation, RecommendationLog, ArtistNameIndex, Artist, Album, Track
 
 
 @admin.register(Recommendation)
@@ -13,6 +13,7 @@ class RecommendationAdmin(admin.ModelAdmin):
     search_fields = ('track_name', 'artist_name', 'user__email')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+    raw_id_fields = ('track',)
 
 
 @admin.register(RecommendationLog)
@@ -23,3 +24,37 @@ class RecommendationLogAdmin(admin.ModelAdmin):
     search_fields = ('user__email',)
     ordering = ('-fetch_timestamp',)
     readonly_fields = ('fetch_timestamp',)
+
+
+@admin.register(ArtistNameIndex)
+class ArtistNameIndexAdmin(admin.ModelAdmin):
+    """Admin configuration for ArtistNameIndex model."""
+    list_display = ('name', 'artist_id', 'created_at')
+    search_fields = ('name', 'normalized_name', 'artist_id')
+    ordering = ('normalized_name',)
+    readonly_fields = ('created_at',)
+
+
+@admin.register(Artist)
+class ArtistAdmin(admin.ModelAdmin):
+    """Admin configuration for Artist model."""
+    list_display = ('name', 'id', 'updated_at')
+    search_fields = ('name', 'id')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(Album)
+class AlbumAdmin(admin.ModelAdmin):
+    """Admin configuration for Album model."""
+    list_display = ('name', 'id', 'release_date', 'updated_at')
+    search_fields = ('name', 'id')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(Track)
+class TrackAdmin(admin.ModelAdmin):
+    """Admin configuration for Track model."""
+    list_display = ('name', 'id', 'album', 'popularity', 'updated_at')
+    search_fields = ('name', 'id')
+    raw_id_fields = ('album', 'artists')
+    readonly_fields = ('updated_at',)
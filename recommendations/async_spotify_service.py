@@ -0,0 +1,438 @@
+"""
+Asyncio-native Spotify API client.
+
+AsyncSpotifyService mirrors SpotifyService's lookup surface on top of a
+non-blocking httpx client, so one process can keep hundreds of Spotify
+lookups in flight. It shares the token manager, entity cache and quota with
+the synchronous service.
+
+From async Django views:
+    data = await AsyncSpotifyService().get_recommendations(seed_genres=['rock'])
+
+From Celery tasks (one long-lived event loop, and so one connection pool,
+per worker thread):
+    data = run_sync(AsyncSpotifyService().get_recommendations(seed_genres=['rock']))
+"""
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .circuit_breaker import spotify_breaker
+from .models import ArtistNameIndex
+from .spotify_cache import entity_cache
+from .spotify_quota import BACKGROUND, spotify_quota
+from .spotify_service import (
+    BATCH_SIZE,
+    RETRY_STATUS_CODES,
+    SpotifyService,
+    dedupe_tracks,
+    first_artist_id,
+    is_upstream_failure,
+    merge_artist_resolutions,
+    project_payload,
+    retry_delay,
+    split_artist_identifiers,
+    token_manager,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Everything a lookup may raise for a failed call
+SPOTIFY_ERRORS = (httpx.HTTPError, requests.RequestException)
+
+# httpx clients and in-flight calls are bound to the loop that created them
+_clients = weakref.WeakKeyDictionary()
+_inflight = weakref.WeakKeyDictionary()
+_worker = threading.local()
+
+
+def get_async_client():
+    """Return the shared keep-alive client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            # Like the sync adapter, the transport only retries failed connections
+            transport=httpx.AsyncHTTPTransport(
+                retries=settings.SPOTIFY_MAX_RETRIES,
+                limits=httpx.Limits(
+                    max_connections=settings.SPOTIFY_ASYNC_POOL_SIZE,
+                    max_keepalive_connections=settings.SPOTIFY_ASYNC_POOL_SIZE,
+                ),
+            ),
+            timeout=httpx.Timeout(
+                settings.SPOTIFY_READ_TIMEOUT,
+                connect=settings.SPOTIFY_CONNECT_TIMEOUT,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+def run_sync(coroutine):
+    """
+    Run a coroutine on this thread's long-lived event loop.
+
+    Meant for Celery workers: reusing the loop keeps its httpx connection
+    pool warm across tasks. The loop is recreated after a fork.
+    """
+    loop = getattr(_worker, 'loop', None)
+    if loop is None or loop.is_closed() or _worker.pid != os.getpid():
+        loop = asyncio.new_event_loop()
+        _worker.loop = loop
+        _worker.pid = os.getpid()
+    return loop.run_until_complete(coroutine)
+
+
+class AsyncSpotifyService:
+    """
+    Non-blocking counterpart of SpotifyService.
+    """
+
+    def __init__(self, priority=BACKGROUND):
+        self.BASE_URL = settings.SPOTIFY_API_BASE_URL
+        self.priority = priority
+        # Used for token renewal, which is rare and goes through a Redis lock
+        self._sync_service = SpotifyService(priority=priority)
+
+    async def _get_access_token(self):
+        token = token_manager.peek()
+        if token:
+            return token
+        return await sync_to_async(
+            self._sync_service._get_access_token, thread_sensitive=False
+        )()
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Perform an authorized request with the same policy as the sync
+        service: retry 429/5xx and read timeouts honouring Retry-After, and
+        renew the token once on a 401. Shares the circuit breaker too.
+        """
+        client = get_async_client()
+        token_renewed = False
+        attempt = 0
+        before_call = sync_to_async(spotify_breaker.before_call, thread_sensitive=False)
+        record_success = sync_to_async(spotify_breaker.record_success, thread_sensitive=False)
+        record_failure = sync_to_async(spotify_breaker.record_failure, thread_sensitive=False)
+        while True:
+            probe = await before_call()
+            try:
+                token = await self._get_access_token()
+                await spotify_quota.aacquire(self.priority)
+            except Exception:
+                await sync_to_async(spotify_breaker.release_probe, thread_sensitive=False)(probe)
+                raise
+            try:
+                response = await client.request(
+                    method, url, headers=self._sync_service._get_headers(token), **kwargs
+                )
+            except httpx.TransportError as e:
+                await record_failure(probe)
+                if not isinstance(e, httpx.ReadTimeout) or attempt >= settings.SPOTIFY_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(retry_delay(None, attempt))
+                attempt += 1
+                continue
+
+            if is_upstream_failure(response.status_code):
+                await record_failure(probe)
+            else:
+                await record_success(probe)
+
+            if response.status_code == 401 and not token_renewed:
+                logger.warning("Spotify rejected the access token; renewing")
+                await sync_to_async(token_manager.invalidate, thread_sensitive=False)(token)
+                token_renewed = True
+                continue
+            if response.status_code in RETRY_STATUS_CODES and attempt < settings.SPOTIFY_MAX_RETRIES:
+                await asyncio.sleep(retry_delay(response, attempt))
+                attempt += 1
+                continue
+
+            response.raise_for_status()
+            return response
+
+    async def _get_json(self, url, params=None):
+        """
+        GET and decode a resource; None when Spotify reports it missing.
+        Identical concurrent calls on this loop share one request.
+        """
+        loop = asyncio.get_running_loop()
+        calls = _inflight.setdefault(loop, {})
+        key = (url, tuple(sorted((params or {}).items())))
+        if key in calls:
+            return await asyncio.shield(calls[key])
+
+        future = loop.create_future()
+        calls[key] = future
+        try:
+            result = await self._fetch_json(url, params)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            calls.pop(key, None)
+
+    async def _fetch_json(self, url, params=None):
+        try:
+            response = await self._request('GET', url, params=params)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (400, 404):
+                return None
+            raise
+        return project_payload(response.json())
+
+    async def _cached(self, endpoint, parts, fetch):
+        found, value = await entity_cache.aget(endpoint, parts)
+        if found:
+            return value
+        value = await fetch()
+        await entity_cache.aset(endpoint, parts, value)
+        return value
+
+    async def search_tracks(self, query, limit=20):
+        """
+        Search for tracks on Spotify.
+        """
+        params = {'q': query, 'type': 'track', 'limit': limit}
+        try:
+            return await self._get_json(f"{self.BASE_URL}/search", params=params)
+        except SPOTIFY_ERRORS as e:
+            logger.error(f"Error searching tracks: {str(e)}")
+            return None
+
+    async def search_artists(self, query, limit=10):
+        """
+        Search for artists on Spotify.
+        """
+        params = {'q': query, 'type': 'artist', 'limit': limit}
+
+        async def fetch():
+            result = await self._get_json(f"{self.BASE_URL}/search", params=params)
+            if result and result.get('artists', {}).get('items'):
+                return result
+            return None
+
+        try:
+            return await self._cached('search_artists', (query.strip().lower(), limit), fetch)
+        except SPOTIFY_ERRORS as e:
+            logger.error(f"Error searching artists: {str(e)}")
+            return None
+
+    async def _search_tracks_for_recommendations(self, query, limit=10):
+        params = {'q': query, 'type': 'track', 'limit': limit}
+
+        async def fetch():
+            result = await self._get_json(f"{self.BASE_URL}/search", params=params)
+            if result and result.get('tracks', {}).get('items'):
+                return result['tracks']['items']
+            return None
+
+        try:
+            return await self._cached('search_tracks', (query.strip().lower(), limit), fetch) or []
+        except SPOTIFY_ERRORS as e:
+            logger.error(f"Error searching tracks: {str(e)}")
+            return []
+
+    async def get_artist(self, artist_id):
+        """
+        Get artist details by ID.
+        """
+        url = f"{self.BASE_URL}/artists/{artist_id}"
+        try:
+            return await self._cached('artist', (artist_id,), lambda: self._get_json(url))
+        except SPOTIFY_ERRORS as e:
+            logger.error(f"Error getting artist: {str(e)}")
+            return None
+
+    async def get_track(self, track_id):
+        """
+        Get track details by ID.
+        """
+        url = f"{self.BASE_URL}/tracks/{track_id}"
+        try:
+            return await self._cached('track', (track_id,), lambda: self._get_json(url))
+        except SPOTIFY_ERRORS as e:
+            logger.error(f"Error getting track: {str(e)}")
+            return None
+
+    async def get_artist_top_tracks(self, artist_id, market='US'):
+        """Get an artist's top tracks."""
+        url = f"{self.BASE_URL}/artists/{artist_id}/top-tracks"
+
+        async def fetch():
+            data = await self._get_json(url, params={'market': market})
+            return (data or {}).get('tracks') or None
+
+        try:
+            return await self._cached('top_tracks', (artist_id, market), fetch) or []
+        except SPOTIFY_ERRORS as e:
+            logger.error(f"Error getting artist top tracks: {str(e)}")
+            return []
+
+    async def get_tracks(self, track_ids):
+        """Get many tracks by ID; see SpotifyService.get_tracks."""
+        return await self._get_many('track', 'tracks', track_ids)
+
+    async def get_artists(self, artist_ids):
+        """Get many artists by ID; see SpotifyService.get_artists."""
+        return await self._get_many('artist', 'artists', artist_ids)
+
+    async def _get_many(self, endpoint, resource, ids):
+        results = {}
+        missing = []
+        for entity_id in dict.fromkeys(ids):
+            found, value = await entity_cache.aget(endpoint, (entity_id,))
+            if found:
+                results[entity_id] = value
+            else:
+                missing.append(entity_id)
+
+        url = f"{self.BASE_URL}/{resource}"
+
+        async def fetch_chunk(chunk):
+            try:
+                data = await self._get_json(url, params={'ids': ','.join(chunk)})
+            except SPOTIFY_ERRORS as e:
+                logger.error(f"Error getting {resource} batch: {str(e)}")
+                return
+            for entity_id, entity in zip(chunk, (data or {}).get(resource) or []):
+                await entity_cache.aset(endpoint, (entity_id,), entity)
+                results[entity_id] = entity
+
+        await asyncio.gather(*(
+            fetch_chunk(missing[start:start + BATCH_SIZE])
+            for start in range(0, len(missing), BATCH_SIZE)
+        ))
+        return results
+
+    async def resolve_artist_ids(self, identifiers):
+        """Map seed artist names or IDs to Spotify IDs through ArtistNameIndex."""
+        resolved, names = split_artist_identifiers(identifiers)
+        if not names:
+            return resolved
+
+        known = await sync_to_async(ArtistNameIndex.lookup)(names)
+        unknown = [normalized for normalized in names if normalized not in known]
+        results = await asyncio.gather(*(
+            self.search_artists(names[normalized], limit=1) for normalized in unknown
+        ))
+
+        new_entries = []
+        for normalized, result in zip(unknown, results):
+            artist_id = first_artist_id(result)
+            if artist_id:
+                known[normalized] = artist_id
+                new_entries.append((names[normalized], artist_id))
+        if new_entries:
+            await sync_to_async(ArtistNameIndex.remember)(new_entries)
+
+        return merge_artist_resolutions(identifiers, resolved, known)
+
+    async def _artist_recommendations(self, artist_id, limit):
+        top_tracks, artist_info = await asyncio.gather(
+            self.get_artist_top_tracks(artist_id),
+            self.get_artist(artist_id),
+        )
+        recommendations = list(top_tracks[:limit])
+        if artist_info and artist_info.get('genres'):
+            recommendations.extend(await self._search_tracks_for_recommendations(
+                f"genre:{artist_info['genres'][0]}", limit=3
+            ))
+        return recommendations
+
+    async def _track_recommendations(self, track_id):
+        track = await self.get_track(track_id)
+        if not track:
+            return []
+        return await self._search_tracks_for_recommendations(
+            f"artist:{track['artists'][0]['name']}", limit=3
+        )
+
+    async def _gather_with_deadline(self, coroutines):
+        """Results per coroutine in order; failures and stragglers give []."""
+        if not coroutines:
+            return []
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        done, pending = await asyncio.wait(
+            tasks, timeout=settings.SPOTIFY_RECOMMENDATIONS_DEADLINE
+        )
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(
+                f"{len(pending)} of {len(tasks)} Spotify lookups missed the "
+                f"{settings.SPOTIFY_RECOMMENDATIONS_DEADLINE}s deadline"
+            )
+
+        results = []
+        for task in tasks:
+            if task in pending:
+                results.append([])
+            elif task.exception() is not None:
+                logger.error(f"Error in recommendation lookup: {str(task.exception())}")
+                results.append([])
+            else:
+                results.append(task.result())
+        return results
+
+    async def get_recommendations(self, seed_genres=None, seed_artists=None, seed_tracks=None,
+                                  limit=20, **kwargs):
+        """
+        Get recommendations using the same strategies and merge order as
+        SpotifyService.get_recommendations, with every lookup in flight at once.
+        """
+        try:
+            artists = (seed_artists or [])[:2]
+            artist_ids = await self.resolve_artist_ids(artists)
+
+            # Warm the entity cache with one batch call per entity type
+            await asyncio.gather(
+                self.get_artists(list(artist_ids.values())),
+                self.get_tracks((seed_tracks or [])[:2]),
+            )
+
+            jobs = []
+            if seed_genres:
+                genres = seed_genres[:3]
+                for genre in genres:
+                    jobs.append(self._search_tracks_for_recommendations(
+                        f"genre:{genre}", limit=limit//len(genres)
+                    ))
+            for artist_identifier in artists:
+                if artist_identifier in artist_ids:
+                    jobs.append(self._artist_recommendations(
+                        artist_ids[artist_identifier], limit//len(artists)
+                    ))
+            for track_id in (seed_tracks or [])[:2]:
+                jobs.append(self._track_recommendations(track_id))
+
+            recommendations = []
+            for tracks in await self._gather_with_deadline(jobs):
+                recommendations.extend(tracks)
+
+            if not recommendations:
+                recommendations = await self._search_tracks_for_recommendations(
+                    "year:2023-2025", limit=limit
+                )
+
+            return {
+                'tracks': dedupe_tracks(recommendations, limit)
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting recommendations: {str(e)}")
+            return None
@@ -0,0 +1,162 @@
+"""
+Circuit breaker around Spotify calls, shared by every worker through Redis.
+
+Closed: calls flow and outcomes are counted in a sliding window. Once the
+window holds at least SPOTIFY_BREAKER_MIN_CALLS calls and the failure rate
+reaches SPOTIFY_BREAKER_FAILURE_RATE, the breaker opens.
+
+Open: calls fail fast with SpotifyUnavailable for SPOTIFY_BREAKER_OPEN_SECONDS.
+
+Half-open: one probe call at a time is let through. A success closes the
+breaker and starts a fresh window; a failure opens it again.
+"""
+import threading
+import time
+import requests
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyUnavailable(requests.RequestException):
+    """Raised instead of calling Spotify while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker with Redis-backed shared state.
+    """
+
+    def __init__(self, name='spotify'):
+        self.prefix = f'breaker:{name}'
+        self.open_key = f'{self.prefix}:open'
+        self.half_open_key = f'{self.prefix}:half_open'
+        self.probe_key = f'{self.prefix}:probe'
+        self.generation_key = f'{self.prefix}:generation'
+        # Shared state is re-read at most once per SPOTIFY_BREAKER_STATE_TTL
+        self._state = None
+        self._state_read_at = 0
+        self._lock = threading.Lock()
+
+    def _read_state(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if force or self._state is None or now - self._state_read_at > settings.SPOTIFY_BREAKER_STATE_TTL:
+                values = cache.get_many([self.open_key, self.half_open_key, self.generation_key])
+                self._state = {
+                    'open': bool(values.get(self.open_key)),
+                    'half_open': bool(values.get(self.half_open_key)),
+                    'generation': values.get(self.generation_key, 0),
+                }
+                self._state_read_at = now
+            return self._state
+
+    @property
+    def state(self):
+        state = self._read_state()
+        if state['open']:
+            return 'open'
+        if state['half_open']:
+            return 'half_open'
+        return 'closed'
+
+    def is_open(self):
+        return self._read_state()['open']
+
+    def before_call(self):
+        """
+        Return True if the call is a half-open probe. Raises
+        SpotifyUnavailable when the call must not be made.
+        """
+        state = self._read_state()
+        if state['open']:
+            raise SpotifyUnavailable("Spotify circuit breaker is open")
+        if state['half_open']:
+            if cache.add(self.probe_key, 1, settings.SPOTIFY_BREAKER_PROBE_TIMEOUT):
+                return True
+            raise SpotifyUnavailable("Spotify circuit breaker is half-open; probe in flight")
+        return False
+
+    def record_success(self, probe=False):
+        if probe:
+            self._close()
+            return
+        self._count('success')
+
+    def release_probe(self, probe=False):
+        """Give up a probe that was never sent so the next call can make it."""
+        if probe:
+            cache.delete(self.probe_key)
+
+    def record_failure(self, probe=False):
+        if probe:
+            logger.warning("Spotify probe call failed; circuit stays open")
+            self._open()
+            return
+        self._count('failure')
+        self._evaluate()
+
+    def _slot_keys(self, generation, slot):
+        base = f'{self.prefix}:{generation}:{slot}'
+        return f'{base}:success', f'{base}:failure'
+
+    def _current_slots(self):
+        bucket = settings.SPOTIFY_BREAKER_BUCKET_SECONDS
+        newest = int(time.time() // bucket)
+        count = max(1, settings.SPOTIFY_BREAKER_WINDOW_SECONDS // bucket)
+        return [newest - i for i in range(count)]
+
+    def _count(self, outcome):
+        generation = self._read_state()['generation']
+        success_key, failure_key = self._slot_keys(generation, self._current_slots()[0])
+        key = success_key if outcome == 'success' else failure_key
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, settings.SPOTIFY_BREAKER_WINDOW_SECONDS + settings.SPOTIFY_BREAKER_BUCKET_SECONDS)
+            cache.incr(key)
+
+    def failure_rate(self):
+        """Return (calls, failure_rate) over the sliding window."""
+        generation = self._read_state()['generation']
+        keys = [
+            key for slot in self._current_slots()
+            for key in self._slot_keys(generation, slot)
+        ]
+        values = cache.get_many(keys)
+        successes = sum(values.get(key, 0) for key in keys[0::2])
+        failures = sum(values.get(key, 0) for key in keys[1::2])
+        calls = successes + failures
+        return calls, (failures / calls if calls else 0.0)
+
+    def _evaluate(self):
+        calls, rate = self.failure_rate()
+        if calls >= settings.SPOTIFY_BREAKER_MIN_CALLS and rate >= settings.SPOTIFY_BREAKER_FAILURE_RATE:
+            logger.error(
+                f"Opening Spotify circuit breaker: {rate:.0%} of {calls} calls failed"
+            )
+            self._open()
+
+    def _open(self):
+        cache.set(self.open_key, 1, settings.SPOTIFY_BREAKER_OPEN_SECONDS)
+        # Outlives the open period so the first call after it becomes a probe
+        cache.set(self.half_open_key, 1, None)
+        cache.delete(self.probe_key)
+        self._read_state(force=True)
+
+    def _close(self):
+        logger.info("Spotify probe call succeeded; closing circuit breaker")
+        try:
+            cache.incr(self.generation_key)
+        except ValueError:
+            cache.set(self.generation_key, 1, None)
+        cache.delete_many([self.open_key, self.half_open_key, self.probe_key])
+        self._read_state(force=True)
+
+    def reset(self):
+        self._close()
+
+
+spotify_breaker = CircuitBreaker()
@@ -0,0 +1,340 @@
+"""
+Local stand-in for the Spotify Web API.
+
+Serves the endpoints SpotifyService uses (token, search, artists, artist top
+tracks, tracks) from recorded fixtures, falling back to deterministic
+synthetic data, with configurable latency, 5xx and 429 injection. Point the
+service at it with:
+
+    SPOTIFY_API_BASE_URL=http://localhost:8899/v1
+    SPOTIFY_AUTH_URL=http://localhost:8899/api/token
+
+Run it with `python manage.py run_fake_spotify`. With `--record`, requests
+without a fixture are forwarded to the real API and the answers are saved
+for later offline replay.
+"""
+import base64
+import hashlib
+import json
+import random
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import requests
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE62 = string.digits + string.ascii_letters
+MARKETS = ['AD', 'AR', 'AT', 'AU', 'BE', 'BR', 'CA', 'CH', 'DE', 'DK', 'ES', 'FI',
+           'FR', 'GB', 'IE', 'IT', 'JP', 'MX', 'NL', 'NO', 'NZ', 'PL', 'SE', 'US']
+GENRES = ['pop', 'rock', 'jazz', 'blues', 'hip-hop', 'electronic', 'indie', 'metal']
+
+
+def fake_id(seed):
+    """Deterministic 22-character base62 Spotify-style ID."""
+    number = int(hashlib.md5(seed.encode()).hexdigest(), 16)
+    chars = []
+    for _ in range(22):
+        number, index = divmod(number, 62)
+        chars.append(BASE62[index])
+    return ''.join(chars)
+
+
+def fixture_key(method, path, params):
+    """Normalized key a response is recorded under."""
+    query = urlencode(sorted(params.items()))
+    return f"{method} {path}?{query}" if query else f"{method} {path}"
+
+
+class SyntheticCatalog:
+    """Generates stable Spotify-shaped payloads from IDs and queries."""
+
+    def artist(self, artist_id):
+        rng = random.Random(artist_id)
+        return {
+            'id': artist_id,
+            'name': f"Artist {artist_id[:6]}",
+            'type': 'artist',
+            'genres': rng.sample(GENRES, 2),
+            'popularity': rng.randint(0, 100),
+            'followers': {'href': None, 'total': rng.randint(0, 10 ** 7)},
+            'images': self._images(f'artist-{artist_id}'),
+            'external_urls': {'spotify': f'https://open.spotify.com/artist/{artist_id}'},
+            'href': f'https://api.spotify.com/v1/artists/{artist_id}',
+            'uri': f'spotify:artist:{artist_id}',
+        }
+
+    def track(self, track_id):
+        rng = random.Random(track_id)
+        artist = self._artist_ref(fake_id(f'artist-of-{track_id}'))
+        album_id = fake_id(f'album-of-{track_id}')
+        return {
+            'id': track_id,
+            'name': f"Track {track_id[:6]}",
+            'type': 'track',
+            'artists': [artist],
+            'album': {
+                'id': album_id,
+                'name': f"Album {album_id[:6]}",
+                'album_type': 'album',
+                'artists': [artist],
+                'images': self._images(f'album-{album_id}'),
+                'release_date': f"{rng.randint(1960, 2025)}-01-01",
+                'available_markets': MARKETS,
+                'external_urls': {'spotify': f'https://open.spotify.com/album/{album_id}'},
+                'uri': f'spotify:album:{album_id}',
+            },
+            'available_markets': MARKETS,
+            'duration_ms': rng.randint(120000, 360000),
+            'explicit': rng.random() < 0.2,
+            'popularity': rng.randint(0, 100),
+            'preview_url': f'https://p.scdn.co/mp3-preview/{track_id}',
+            'track_number': rng.randint(1, 12),
+            'external_ids': {'isrc': f'US{track_id[:10].upper()}'},
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+            'href': f'https://api.spotify.com/v1/tracks/{track_id}',
+            'uri': f'spotify:track:{track_id}',
+        }
+
+    def top_tracks(self, artist_id):
+        tracks = [self.track(fake_id(f'top-{artist_id}-{i}')) for i in range(10)]
+        for track in tracks:
+            track['artists'][0] = self._artist_ref(artist_id)
+        return {'tracks': tracks}
+
+    def search(self, query, search_type, limit):
+        if search_type == 'artist':
+            items = [self.artist(fake_id(f'search-artist-{query}-{i}')) for i in range(limit)]
+            return {'artists': self._page(items, limit)}
+        items = [self.track(fake_id(f'search-track-{query}-{i}')) for i in range(limit)]
+        return {'tracks': self._page(items, limit)}
+
+    def _artist_ref(self, artist_id):
+        return {
+            'id': artist_id,
+            'name': f"Artist {artist_id[:6]}",
+            'type': 'artist',
+            'external_urls': {'spotify': f'https://open.spotify.com/artist/{artist_id}'},
+            'uri': f'spotify:artist:{artist_id}',
+        }
+
+    def _images(self, seed):
+        return [
+            {'url': f'https://i.scdn.co/image/{fake_id(f"{seed}-{size}")}', 'height': size, 'width': size}
+            for size in (640, 300, 64)
+        ]
+
+    def _page(self, items, limit):
+        return {'items': items, 'limit': limit, 'offset': 0, 'total': 1000, 'next': None}
+
+
+class SpotifyRecorder:
+    """
+    Forwards fixture misses to the real Spotify API.
+    """
+    API_URL = 'https://api.spotify.com'
+    AUTH_URL = 'https://accounts.spotify.com/api/token'
+
+    def __init__(self, client_id, client_secret):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = requests.Session()
+        self._token = None
+        self._expires_at = 0
+
+    def _get_token(self):
+        if self._token and time.time() < self._expires_at - 60:
+            return self._token
+        credentials = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+        response = self.session.post(
+            self.AUTH_URL,
+            headers={'Authorization': f'Basic {credentials}'},
+            data={'grant_type': 'client_credentials'},
+            timeout=10
+        )
+        response.raise_for_status()
+        token_data = response.json()
+        self._token = token_data['access_token']
+        self._expires_at = time.time() + token_data.get('expires_in', 3600)
+        return self._token
+
+    def __call__(self, method, path, params):
+        response = self.session.request(
+            method,
+            f'{self.API_URL}{path}',
+            params=params,
+            headers={'Authorization': f'Bearer {self._get_token()}'},
+            timeout=10
+        )
+        return response.status_code, response.json() if response.content else {}
+
+
+class FakeSpotify:
+    """
+    Request router plus fault injection, shared by all handler threads.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, fixtures=None, seed=None, upstream=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.fixtures = fixtures or {}
+        # Called as upstream(method, path, params) -> (status, body) on a
+        # fixture miss; successful answers are recorded into self.fixtures.
+        self.upstream = upstream
+        self.catalog = SyntheticCatalog()
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load_fixtures(cls, path):
+        with open(path) as f:
+            return json.load(f)
+
+    def save_fixtures(self, path):
+        with self._lock:
+            fixtures = dict(self.fixtures)
+        with open(path, 'w') as f:
+            json.dump(fixtures, f, indent=1, sort_keys=True)
+
+    def handle(self, method, path, params):
+        """Return (status, headers, body) for one request."""
+        with self._lock:
+            self.requests += 1
+            roll = self.random.random()
+            delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+
+        if path == '/api/token':
+            return 200, {}, {'access_token': 'fake-token', 'token_type': 'Bearer', 'expires_in': 3600}
+        if roll < self.rate_limit_rate:
+            return 429, {'Retry-After': str(self.retry_after)}, {
+                'error': {'status': 429, 'message': 'API rate limit exceeded'}
+            }
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 503, {}, {'error': {'status': 503, 'message': 'Service unavailable'}}
+
+        key = fixture_key(method, path, params)
+        if key in self.fixtures:
+            return 200, {}, self.fixtures[key]
+
+        if self.upstream is not None:
+            status, body = self.upstream(method, path, params)
+            if status == 200:
+                with self._lock:
+                    self.fixtures[key] = body
+            return status, {}, body
+
+        body = self.synthesize(path, params)
+        if body is None:
+            return 404, {}, {'error': {'status': 404, 'message': 'Non existing id'}}
+        return 200, {}, body
+
+    def synthesize(self, path, params):
+        parts = [part for part in path.split('/') if part]
+        if not parts or parts[0] != 'v1':
+            return None
+        parts = parts[1:]
+
+        if parts == ['search']:
+            limit = min(int(params.get('limit', 20)), 50)
+            return self.catalog.search(params.get('q', ''), params.get('type', 'track'), limit)
+        if parts == ['artists'] and 'ids' in params:
+            return {'artists': [self.catalog.artist(i) for i in params['ids'].split(',')]}
+        if parts == ['tracks'] and 'ids' in params:
+            return {'tracks': [self.catalog.track(i) for i in params['ids'].split(',')]}
+        if len(parts) == 2 and parts[0] == 'artists':
+            return self.catalog.artist(parts[1])
+        if len(parts) == 3 and parts[0] == 'artists' and parts[2] == 'top-tracks':
+            return self.catalog.top_tracks(parts[1])
+        if len(parts) == 2 and parts[0] == 'tracks':
+            return self.catalog.track(parts[1])
+        return None
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """HTTP front end for a FakeSpotify instance."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        status, headers, body = self.server.fake.handle(method, url.path, params)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class FakeSpotifyServer:
+    """
+    Threaded server wrapper usable from tests and benchmarks.
+
+    Usage:
+        with FakeSpotifyServer(latency_ms=20) as server:
+            with override_settings(SPOTIFY_API_BASE_URL=server.api_url,
+                                   SPOTIFY_AUTH_URL=server.auth_url):
+                ...
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        self.fake = FakeSpotify(**options)
+        self.httpd = ThreadingHTTPServer((host, port), FakeSpotifyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self.fake
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def api_url(self):
+        return f'{self.base_url}/v1'
+
+    @property
+    def auth_url(self):
+        return f'{self.base_url}/api/token'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
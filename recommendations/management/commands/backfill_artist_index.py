@@ -0,0 +1,49 @@
+"""
+Populate ArtistNameIndex from the artist names stored on user profiles.
+"""
+from django.core.management.base import BaseCommand
+from recommendations.models import ArtistNameIndex
+from recommendations.spotify_service import SPOTIFY_ID_RE, SpotifyService
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Resolve every favorite artist name on user profiles to a Spotify ID.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Names to resolve per batch (default: 50)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        names = {}
+        profiles = UserProfile.objects.values_list('favorite_artists', flat=True)
+        for favorite_artists in profiles.iterator(chunk_size=2000):
+            for name in favorite_artists or []:
+                if isinstance(name, str) and name.strip() and not SPOTIFY_ID_RE.match(name):
+                    names.setdefault(ArtistNameIndex.normalize(name), name)
+
+        indexed = set(
+            ArtistNameIndex.objects.filter(normalized_name__in=names)
+            .values_list('normalized_name', flat=True)
+        )
+        pending = [name for normalized, name in names.items() if normalized not in indexed]
+        self.stdout.write(
+            f"{len(names)} distinct artist names, {len(pending)} not yet indexed"
+        )
+
+        service = SpotifyService()
+        resolved = 0
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            resolved += len(service.resolve_artist_ids(batch))
+            self.stdout.write(f"Processed {min(start + batch_size, len(pending))}/{len(pending)}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Resolved {resolved} of {len(pending)} artist names"
+        ))
@@ -0,0 +1,28 @@
+"""
+Show hit ratios of the per-user recommendation cache.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recommendations import recommendation_cache
+
+
+class Command(BaseCommand):
+    help = 'Print recommendation cache hit ratio with and without refresh-ahead.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = recommendation_cache.stats()
+        state = 'on' if settings.RECOMMENDATION_REFRESH_AHEAD_ENABLED else 'off'
+        self.stdout.write(
+            f"Refresh-ahead: {state} (factor {settings.RECOMMENDATION_REFRESH_AHEAD_FACTOR})\n"
+            f"Hits: {stats['hits']}  Misses: {stats['misses']}  "
+            f"Background rebuilds: {stats['refreshes']}  Misses avoided: {stats['saved_misses']}\n"
+            f"Hit ratio: {stats['hit_ratio']:.1%} "
+            f"(without refresh-ahead: {stats['hit_ratio_without_refresh_ahead']:.1%})"
+        )
+        if options['reset']:
+            recommendation_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,73 @@
+"""
+Run the local Spotify stand-in server.
+"""
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recommendations.fake_spotify import FakeSpotify, FakeSpotifyServer, SpotifyRecorder
+
+
+class Command(BaseCommand):
+    help = 'Serve a fake Spotify Web API from fixtures or synthetic data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8899)
+        parser.add_argument('--latency-ms', type=float, default=0,
+                            help='Fixed latency added to every response')
+        parser.add_argument('--jitter-ms', type=float, default=0,
+                            help='Random extra latency, uniform in [0, jitter]')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of API calls answered with 503')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                            help='Fraction of API calls answered with 429')
+        parser.add_argument('--retry-after', type=int, default=1,
+                            help='Retry-After seconds sent with injected 429s')
+        parser.add_argument('--fixtures', help='JSON file of recorded responses to replay')
+        parser.add_argument('--record', action='store_true',
+                            help='Forward fixture misses to the real Spotify API and '
+                                 'save the answers to --fixtures on exit')
+        parser.add_argument('--seed', type=int, help='Seed for latency and fault injection')
+
+    def handle(self, *args, **options):
+        fixtures_path = options['fixtures']
+        if options['record'] and not fixtures_path:
+            self.stderr.write(self.style.ERROR('--record needs --fixtures to save to'))
+            return
+
+        fixtures = {}
+        if fixtures_path and os.path.exists(fixtures_path):
+            fixtures = FakeSpotify.load_fixtures(fixtures_path)
+
+        upstream = None
+        if options['record']:
+            upstream = SpotifyRecorder(settings.SPOTIFY_CLIENT_ID, settings.SPOTIFY_CLIENT_SECRET)
+
+        server = FakeSpotifyServer(
+            host=options['host'],
+            port=options['port'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            retry_after=options['retry_after'],
+            fixtures=fixtures,
+            seed=options['seed'],
+            upstream=upstream,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake Spotify listening on {server.base_url} "
+            f"({len(fixtures)} fixtures loaded)\n"
+            f"  SPOTIFY_API_BASE_URL={server.api_url}\n"
+            f"  SPOTIFY_AUTH_URL={server.auth_url}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            if options['record']:
+                server.fake.save_fixtures(fixtures_path)
+                self.stdout.write(f"Saved {len(server.fake.fixtures)} fixtures to {fixtures_path}")
+            self.stdout.write(f"Served {server.fake.requests} requests")
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.3 on 2026-10-17 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtistNameIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_name', models.CharField(max_length=255, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('artist_id', models.CharField(max_length=22)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'artist name index',
+            },
+        ),
+    ]
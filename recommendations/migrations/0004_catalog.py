@@ -0,0 +1,48 @@
+# Generated by Django 4.2.3 on 2026-10-17 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0003_artistnameindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Album',
+            fields=[
+                ('id', models.CharField(max_length=22, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=500)),
+                ('image_url', models.URLField(blank=True, null=True)),
+                ('release_date', models.CharField(blank=True, max_length=10)),
+                ('spotify_url', models.URLField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Artist',
+            fields=[
+                ('id', models.CharField(max_length=22, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=500)),
+                ('spotify_url', models.URLField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Track',
+            fields=[
+                ('id', models.CharField(max_length=22, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=500)),
+                ('duration_ms', models.IntegerField(default=0)),
+                ('popularity', models.IntegerField(default=0)),
+                ('preview_url', models.URLField(blank=True, null=True)),
+                ('spotify_url', models.URLField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('album', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tracks', to='recommendations.album')),
+                ('artists', models.ManyToManyField(blank=True, related_name='tracks', to='recommendations.artist')),
+            ],
+        ),
+    ]
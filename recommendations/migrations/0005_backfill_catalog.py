@@ -0,0 +1,101 @@
+"""
+Move the artist/album blobs in Recommendation.metadata into the catalog.
+
+Every recommended track gets a Track row (built from the row's own columns
+when it has no metadata) so the next migration can turn track_id into a
+foreign key. The blobs are cleared afterwards.
+"""
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def backfill_catalog(apps, schema_editor):
+    Recommendation = apps.get_model('recommendations', 'Recommendation')
+    Track = apps.get_model('recommendations', 'Track')
+    Artist = apps.get_model('recommendations', 'Artist')
+    Album = apps.get_model('recommendations', 'Album')
+    TrackArtist = Track.artists.through
+
+    def flush(tracks, artists, albums, track_artists):
+        Artist.objects.bulk_create(artists.values(), ignore_conflicts=True)
+        Album.objects.bulk_create(albums.values(), ignore_conflicts=True)
+        Track.objects.bulk_create(tracks.values(), ignore_conflicts=True)
+        TrackArtist.objects.bulk_create([
+            TrackArtist(track_id=track_id, artist_id=artist_id)
+            for track_id, artist_id in track_artists
+        ], ignore_conflicts=True)
+
+    seen = set()
+    tracks, artists, albums, track_artists = {}, {}, {}, set()
+    rows = Recommendation.objects.order_by('-created_at').values(
+        'track_id', 'track_name', 'album_name', 'album_art_url', 'preview_url',
+        'spotify_url', 'duration_ms', 'popularity', 'metadata'
+    )
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        # Newest row wins when a track was recommended more than once
+        if row['track_id'] in seen:
+            continue
+        seen.add(row['track_id'])
+        metadata = row['metadata'] or {}
+        album = metadata.get('album') or {}
+        if album.get('id'):
+            images = album.get('images') or []
+            albums[album['id']] = Album(
+                id=album['id'],
+                name=album.get('name') or row['album_name'],
+                image_url=images[0]['url'] if images else row['album_art_url'],
+                release_date=(album.get('release_date') or '')[:10],
+                spotify_url=(album.get('external_urls') or {}).get('spotify', ''),
+            )
+        for artist in metadata.get('artists') or []:
+            if artist.get('id'):
+                artists[artist['id']] = Artist(
+                    id=artist['id'],
+                    name=artist.get('name', ''),
+                    spotify_url=(artist.get('external_urls') or {}).get('spotify', ''),
+                )
+                track_artists.add((row['track_id'], artist['id']))
+        tracks[row['track_id']] = Track(
+            id=row['track_id'],
+            name=row['track_name'],
+            album_id=album.get('id'),
+            duration_ms=row['duration_ms'],
+            popularity=row['popularity'],
+            preview_url=row['preview_url'],
+            spotify_url=row['spotify_url'],
+        )
+        if len(tracks) >= BATCH_SIZE:
+            flush(tracks, artists, albums, track_artists)
+            tracks, artists, albums, track_artists = {}, {}, {}, set()
+    flush(tracks, artists, albums, track_artists)
+
+    Recommendation.objects.exclude(metadata={}).update(metadata={})
+
+
+def restore_metadata(apps, schema_editor):
+    Recommendation = apps.get_model('recommendations', 'Recommendation')
+    Track = apps.get_model('recommendations', 'Track')
+
+    catalog = Track.objects.select_related('album').prefetch_related('artists')
+    for track in catalog.iterator(chunk_size=BATCH_SIZE):
+        metadata = {
+            'artists': [{'id': artist.id, 'name': artist.name} for artist in track.artists.all()],
+            'album': {
+                'id': track.album.id,
+                'name': track.album.name,
+                'images': [{'url': track.album.image_url}] if track.album.image_url else [],
+            } if track.album else {},
+        }
+        Recommendation.objects.filter(track_id=track.id).update(metadata=metadata)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_catalog, restore_metadata),
+    ]
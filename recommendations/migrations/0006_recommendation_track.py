@@ -0,0 +1,28 @@
+# Generated by Django 4.2.3 on 2026-10-17 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0005_backfill_catalog'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recommendation',
+            name='recommendat_track_i_299a0f_idx',
+        ),
+        migrations.RenameField(
+            model_name='recommendation',
+            old_name='track_id',
+            new_name='track',
+        ),
+        migrations.AlterField(
+            model_name='recommendation',
+            name='track',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recommendations', to='recommendations.track'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-17 15:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recommendations', '0006_recommendation_track'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dirty_since', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_state', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.3 on 2026-10-17 15:40
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+BATCH_SIZE = 2000
+
+
+def backfill_last_active(apps, schema_editor):
+    """Seed refresh tiers from each user's latest recorded activity."""
+    UserActivity = apps.get_model('analytics', 'UserActivity')
+    RecommendationState = apps.get_model('recommendations', 'RecommendationState')
+
+    latest = (
+        UserActivity.objects.filter(user_id=OuterRef('user_id'))
+        .order_by().values('user_id').annotate(last=Max('timestamp')).values('last')
+    )
+
+    def flush(user_ids):
+        RecommendationState.objects.bulk_create(
+            [RecommendationState(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+        )
+        RecommendationState.objects.filter(user_id__in=user_ids).update(last_active_at=Subquery(latest))
+
+    active_users = UserActivity.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    batch = []
+    for user_id in active_users.iterator(chunk_size=BATCH_SIZE):
+        batch.append(user_id)
+        if len(batch) >= BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_initial'),
+        ('recommendations', '0007_recommendationstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationstate',
+            name='last_active_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recommendationstate',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_active, migrations.RunPython.noop),
+    ]
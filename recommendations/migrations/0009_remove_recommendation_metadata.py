@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-17 10:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0008_recommendationstate_tiers'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recommendation',
+            name='metadata',
+        ),
+    ]
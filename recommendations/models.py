@@ -1,16 +1,156 @@
 """
 Recommendation models for storing Spotify recommendations.
 """
-from django.db import models
+import hashlib
+import unicodedata
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
 from users.models import User
 
 
+def _upsert_stale(model, rows, update_fields, cutoff):
+    """
+    Insert or update rows (a dict keyed by primary key) in primary-key order,
+    leaving rows updated since cutoff alone.
+    """
+    fresh = set(
+        model.objects.filter(pk__in=list(rows), updated_at__gte=cutoff).values_list('pk', flat=True)
+    ) if rows else set()
+    model.objects.bulk_create(
+        [rows[pk] for pk in sorted(rows) if pk not in fresh],
+        update_conflicts=True, unique_fields=['id'], update_fields=update_fields
+    )
+
+
+class Artist(models.Model):
+    """
+    Spotify artist, stored once and shared by every recommendation.
+    """
+    id = models.CharField(max_length=22, primary_key=True)
+    name = models.CharField(max_length=500)
+    spotify_url = models.URLField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Album(models.Model):
+    """
+    Spotify album, with only the cover image the app displays.
+    """
+    id = models.CharField(max_length=22, primary_key=True)
+    name = models.CharField(max_length=500)
+    image_url = models.URLField(blank=True, null=True)
+    release_date = models.CharField(max_length=10, blank=True)
+    spotify_url = models.URLField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Track(models.Model):
+    """
+    Spotify track in the local catalog.
+    """
+    id = models.CharField(max_length=22, primary_key=True)
+    name = models.CharField(max_length=500)
+    album = models.ForeignKey(Album, on_delete=models.SET_NULL, null=True, blank=True, related_name='tracks')
+    artists = models.ManyToManyField(Artist, related_name='tracks', blank=True)
+    duration_ms = models.IntegerField(default=0)
+    popularity = models.IntegerField(default=0)
+    preview_url = models.URLField(blank=True, null=True)
+    spotify_url = models.URLField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def upsert_from_spotify(cls, tracks):
+        """
+        Insert or refresh the catalog rows for Spotify track payloads.
+        
+        Each artist, album and track is written once per call however many
+        payloads share it, and not at all if it was refreshed within
+        CATALOG_REFRESH_INTERVAL. Rows are written in primary-key order in a
+        transaction of their own, so concurrent fetches sharing rows neither
+        deadlock nor hold the locks for longer than the upsert. Returns the
+        Spotify IDs of the upserted tracks.
+        """
+        artists, albums, catalog_tracks, track_artists = {}, {}, {}, set()
+        for track in tracks:
+            album = track.get('album') or {}
+            if album.get('id'):
+                images = album.get('images') or []
+                albums[album['id']] = Album(
+                    id=album['id'],
+                    name=album.get('name', ''),
+                    image_url=images[0]['url'] if images else None,
+                    release_date=(album.get('release_date') or '')[:10],
+                    spotify_url=(album.get('external_urls') or {}).get('spotify', ''),
+                )
+            for artist in track.get('artists') or []:
+                if artist.get('id'):
+                    artists[artist['id']] = Artist(
+                        id=artist['id'],
+                        name=artist.get('name', ''),
+                        spotify_url=(artist.get('external_urls') or {}).get('spotify', ''),
+                    )
+                    track_artists.add((track['id'], artist['id']))
+            catalog_tracks[track['id']] = cls(
+                id=track['id'],
+                name=track.get('name', ''),
+                album_id=album.get('id'),
+                duration_ms=track.get('duration_ms') or 0,
+                popularity=track.get('popularity') or 0,
+                preview_url=track.get('preview_url'),
+                spotify_url=(track.get('external_urls') or {}).get('spotify', ''),
+            )
+
+        cutoff = timezone.now() - timedelta(seconds=settings.CATALOG_REFRESH_INTERVAL)
+        with transaction.atomic():
+            _upsert_stale(Artist, artists, ['name', 'spotify_url', 'updated_at'], cutoff)
+            _upsert_stale(
+                Album, albums, ['name', 'image_url', 'release_date', 'spotify_url', 'updated_at'], cutoff
+            )
+            _upsert_stale(
+                cls, catalog_tracks,
+                ['name', 'album', 'duration_ms', 'popularity', 'preview_url', 'spotify_url', 'updated_at'],
+                cutoff
+            )
+            cls.artists.through.objects.bulk_create([
+                cls.artists.through(track_id=track_id, artist_id=artist_id)
+                for track_id, artist_id in sorted(track_artists)
+            ], ignore_conflicts=True)
+        return list(catalog_tracks)
+
+
+# Lookups that load a recommendation's artist and album details
+CATALOG_LOOKUPS = ('track__album', 'track__artists')
+
+
+class RecommendationQuerySet(models.QuerySet):
+
+    def with_catalog(self):
+        """Load each row's track, album and artists in a constant number of queries."""
+        return self.select_related('track__album').prefetch_related('track__artists')
+
+
 class Recommendation(models.Model):
     """
     Store user recommendations from Spotify.
+    
+    Display fields are denormalized for fast reads; full artist and album
+    details live once in the Track/Artist/Album catalog.
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
-    track_id = models.CharField(max_length=255)
+    track = models.ForeignKey(Track, on_delete=models.PROTECT, related_name='recommendations')
     track_name = models.CharField(max_length=500)
     artist_name = models.CharField(max_length=500)
     album_name = models.CharField(max_length=500, blank=True)
@@ -19,14 +159,14 @@ class Recommendation(models.Model):
     album_art_url = models.URLField(blank=True, null=True)
     duration_ms = models.IntegerField(default=0)
     popularity = models.IntegerField(default=0)
-    metadata = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = RecommendationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', '-created_at']),
-            models.Index(fields=['track_id']),
         ]
 
     def __str__(self):
@@ -50,3 +190,120 @@ class RecommendationLog(models.Model):
 
     def __str__(self):
         return f"Log for {self.user.email} at {self.fetch_timestamp}"
+
+
+class RecommendationState(models.Model):
+    """
+    Per-user inputs-changed flag and last successful refresh time.
+    
+    The tiered scheduler only refreshes users who are dirty, never
+    refreshed, or last refreshed more than their tier's interval ago.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recommendation_state')
+    dirty_since = models.DateTimeField(null=True, blank=True, db_index=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Last activity or recommendation read; decides the user's refresh tier
+    last_active_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Set when the tiered scheduler queues a refresh, so it isn't queued twice
+    queued_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Recommendation state for user {self.user_id}"
+
+    @classmethod
+    def mark_dirty(cls, user_id):
+        """Flag a user's recommendations as out of date."""
+        if cls.objects.filter(user_id=user_id, dirty_since__isnull=True).update(dirty_since=timezone.now()):
+            return
+        cls.objects.bulk_create([cls(user_id=user_id, dirty_since=timezone.now())], ignore_conflicts=True)
+
+    @classmethod
+    def mark_active(cls, user_id):
+        """
+        Record engagement by the user.
+        
+        Written at most once per RECOMMENDATION_ACTIVITY_RESOLUTION per user,
+        so it is cheap enough to call on every read.
+        """
+        if not cache.add(f'recommendation_active_{user_id}', 1, settings.RECOMMENDATION_ACTIVITY_RESOLUTION):
+            return
+        now = timezone.now()
+        if not cls.objects.filter(user_id=user_id).update(last_active_at=now):
+            cls.objects.bulk_create([cls(user_id=user_id, last_active_at=now)], ignore_conflicts=True)
+
+    @classmethod
+    def mark_queued(cls, user_ids, queued_at=None):
+        """Record that refreshes were queued for these users."""
+        queued_at = queued_at or timezone.now()
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=user_ids).update(queued_at=queued_at)
+
+    @classmethod
+    def mark_refreshed(cls, user_id, started_at):
+        """
+        Record a successful refresh that started at started_at.
+        
+        Changes made while it was running keep the user dirty.
+        """
+        updated = cls.objects.filter(user_id=user_id).update(
+            refreshed_at=timezone.now(),
+            dirty_since=Case(
+                When(dirty_since__lt=started_at, then=Value(None)),
+                default=F('dirty_since'),
+            ),
+        )
+        if not updated:
+            cls.objects.bulk_create([cls(user_id=user_id, refreshed_at=timezone.now())], ignore_conflicts=True)
+
+
+class ArtistNameIndex(models.Model):
+    """
+    Shared mapping of normalized artist names to Spotify artist IDs.
+    
+    Populated the first time a name is resolved so every user and worker
+    reuses the answer instead of searching Spotify again.
+    """
+    NAME_MAX_LENGTH = 255
+    
+    normalized_name = models.CharField(max_length=NAME_MAX_LENGTH, unique=True)
+    name = models.CharField(max_length=NAME_MAX_LENGTH)
+    artist_id = models.CharField(max_length=22)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name_plural = 'artist name index'
+
+    def __str__(self):
+        return f"{self.name} -> {self.artist_id}"
+
+    @classmethod
+    def normalize(cls, name):
+        """
+        Case-, diacritics- and whitespace-insensitive form of a name.
+        
+        Forms longer than the column (NFKD can lengthen a name) are cut and
+        end in a digest of the full form, so distinct long names stay apart.
+        """
+        decomposed = unicodedata.normalize('NFKD', name)
+        stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+        normalized = ' '.join(stripped.casefold().split())
+        if len(normalized) > cls.NAME_MAX_LENGTH:
+            digest = hashlib.sha256(normalized.encode()).hexdigest()[:16]
+            normalized = f"{normalized[:cls.NAME_MAX_LENGTH - len(digest) - 1]}#{digest}"
+        return normalized
+
+    @classmethod
+    def lookup(cls, normalized_names):
+        """Return {normalized_name: artist_id} for names already indexed."""
+        return dict(
+            cls.objects.filter(normalized_name__in=list(normalized_names))
+            .values_list('normalized_name', 'artist_id')
+        )
+
+    @classmethod
+    def remember(cls, entries):
+        """Index (name, artist_id) pairs, skipping names already present."""
+        cls.objects.bulk_create([
+            cls(normalized_name=cls.normalize(name), name=name[:cls.NAME_MAX_LENGTH], artist_id=artist_id)
+            for name, artist_id in entries
+        ], ignore_conflicts=True)
@@ -0,0 +1,181 @@
+"""
+Per-user recommendation cache with refresh-ahead.
+
+Entries live under user_recommendations_v2_{user_id} for RECOMMENDATION_CACHE_TTL
+as music_discovery_backend.caching envelopes, so an expired entry is rebuilt
+by one request while the others serve it stale. A read that lands in the last
+RECOMMENDATION_REFRESH_AHEAD_FACTOR of an entry's lifetime queues a background
+rebuild, so users who keep reading never hit an expired key.
+
+The cached value is the recommendations list already encoded as JSON in
+RecommendationSerializer's shape, whichever path wrote it, so a hit is
+spliced into the response body without decoding or re-encoding anything.
+
+Hits, misses and the misses refresh-ahead saved are counted for tuning; see
+stats().
+"""
+import hashlib
+import time
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from music_discovery_backend import caching
+from music_discovery_backend.renderers import dumps
+from .models import CATALOG_LOOKUPS, Recommendation
+from .serializers import RecommendationSerializer
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATS_PREFIX = 'recommendation_cache:stats'
+STATS = ('hits', 'stale_hits', 'misses', 'refreshes', 'saved_misses')
+
+
+def cache_key(user_id):
+    return f'user_recommendations_v2_{user_id}'
+
+
+def _record(name, delta=1):
+    key = f'{STATS_PREFIX}:{name}'
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+
+
+def encode(recommendations):
+    """
+    Cache value for Recommendation instances: {'count', 'json', 'version'},
+    json being the encoded RecommendationSerializer output and version a
+    digest of it.
+    """
+    recommendations = list(recommendations)
+    prefetch_related_objects(recommendations, *CATALOG_LOOKUPS)
+    data = RecommendationSerializer(recommendations, many=True).data
+    content = dumps(data)
+    return {
+        'count': len(data),
+        'json': content,
+        'version': hashlib.blake2b(content, digest_size=12).hexdigest(),
+    }
+
+
+def response_body(user_id, source, value):
+    """The get_user_recommendations response body for a cache value."""
+    head = dumps({'user_id': user_id, 'source': source, 'count': value['count']})
+    return b''.join((head[:-1], b',"recommendations":', value['json'], b'}'))
+
+
+def response_etag(source, value):
+    """Strong ETag of response_body(); user_id is fixed by the URL."""
+    return f'"{value["version"]}-{source}"'
+
+
+def _write(user_id, value, replaces_expiry=None):
+    caching.write_entry(
+        cache_key(user_id), value, settings.RECOMMENDATION_CACHE_TTL,
+        replaces_expiry=replaces_expiry
+    )
+
+
+def set_recommendations(user_id, recommendations, replaces_expiry=None):
+    """
+    Cache a user's recommendations, given as Recommendation instances
+    newest first.
+
+    replaces_expiry is the expiry of the entry a refresh-ahead rebuild
+    replaced; reads after that moment are counted as saved misses.
+    """
+    _write(user_id, encode(recommendations), replaces_expiry)
+
+
+def touch_recommendations(user_id):
+    """Extend a cached entry's lifetime; False if there is none."""
+    entry = caching.read_entry(cache_key(user_id))
+    if entry is None:
+        return False
+    _write(user_id, entry['value'])
+    return True
+
+
+def cached_recommendations(user_id):
+    """The decoded cached recommendations, stale or not, or None; no side effects."""
+    entry = caching.read_entry(cache_key(user_id))
+    return orjson.loads(entry['value']['json']) if entry is not None else None
+
+
+def get_recommendations(user_id):
+    """
+    Return (value, source), value being an encode() result and source
+    'cache' or 'database'.
+
+    Misses and expired entries are rebuilt from the database by a single
+    caller; reads close to expiry queue warm_user_recommendations.
+    """
+    value, state, entry = caching.get_or_build(
+        cache_key(user_id),
+        lambda: build_recommendations(user_id),
+        settings.RECOMMENDATION_CACHE_TTL,
+        replaces_expiry=None,
+    )
+    if state == caching.BUILT:
+        _record('misses')
+        return value, 'database'
+
+    _record('hits' if state == caching.FRESH else 'stale_hits')
+    now = time.time()
+    replaces_expiry = entry.get('replaces_expiry')
+    # First read past the replaced entry's expiry would have been a miss
+    if replaces_expiry and now >= replaces_expiry and cache.add(
+        f'{STATS_PREFIX}:saved:{user_id}:{int(replaces_expiry)}', 1, settings.RECOMMENDATION_CACHE_TTL
+    ):
+        _record('saved_misses')
+    if settings.RECOMMENDATION_REFRESH_AHEAD_ENABLED:
+        window = settings.RECOMMENDATION_CACHE_TTL * settings.RECOMMENDATION_REFRESH_AHEAD_FACTOR
+        if entry['expires_at'] - now <= window:
+            schedule_refresh(user_id, entry['expires_at'])
+    return value, 'cache'
+
+
+def schedule_refresh(user_id, expires_at):
+    """Queue one background rebuild per cache entry."""
+    lock_key = f'user_recommendations_warming_{user_id}'
+    if not cache.add(lock_key, 1, max(1, int(expires_at - time.time()))):
+        return
+    from .tasks import warm_user_recommendations
+    _record('refreshes')
+    warm_user_recommendations.delay(user_id, expires_at)
+
+
+def stored_recommendations(user_id, limit=20):
+    """A user's newest stored recommendations."""
+    return Recommendation.objects.filter(user_id=user_id).order_by('-created_at')[:limit]
+
+
+def build_recommendations(user_id, limit=20):
+    """Cache value for a user's newest stored recommendations."""
+    return encode(stored_recommendations(user_id, limit))
+
+
+def stats():
+    """
+    Return hit/miss counts and hit ratios.
+
+    hit_ratio_without_refresh_ahead treats the misses refresh-ahead saved as
+    misses, i.e. what the ratio would have been with it switched off.
+    """
+    values = cache.get_many([f'{STATS_PREFIX}:{name}' for name in STATS])
+    counts = {name: values.get(f'{STATS_PREFIX}:{name}', 0) for name in STATS}
+    hits = counts['hits'] + counts['stale_hits']
+    lookups = hits + counts['misses']
+    counts['hit_ratio'] = round(hits / lookups, 3) if lookups else 0.0
+    counts['hit_ratio_without_refresh_ahead'] = (
+        round((hits - counts['saved_misses']) / lookups, 3) if lookups else 0.0
+    )
+    return counts
+
+
+def reset_stats():
+    cache.delete_many([f'{STATS_PREFIX}:{name}' for name in STATS])
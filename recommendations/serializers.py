@@ -6,7 +6,14 @@ from .models import Recommendation, RecommendationLog
 
 
 class RecommendationSerializer(serializers.ModelSerializer):
-    """Serializer for Recommendation model."""
+    """
+    Serializer for Recommendation model.
+    
+    metadata carries the artists and album from the catalog; load them with
+    Recommendation.objects.with_catalog() (or prefetch CATALOG_LOOKUPS) to
+    avoid a query per row.
+    """
+    metadata = serializers.SerializerMethodField()
     
     class Meta:
         model = Recommendation
@@ -25,6 +32,23 @@ class RecommendationSerializer(serializers.ModelSerializer):
             'created_at'
         ]
         read_only_fields = ['id', 'created_at']
+    
+    def get_metadata(self, obj):
+        track = obj.track
+        album = track.album
+        return {
+            'artists': [
+                {'id': artist.id, 'name': artist.name, 'external_urls': {'spotify': artist.spotify_url}}
+                for artist in track.artists.all()
+            ],
+            'album': {
+                'id': album.id,
+                'name': album.name,
+                'images': [{'url': album.image_url}] if album.image_url else [],
+                'release_date': album.release_date,
+                'external_urls': {'spotify': album.spotify_url},
+            } if album else {},
+        }
 
 
 class RecommendationLogSerializer(serializers.ModelSerializer):
@@ -0,0 +1,103 @@
+"""
+Request coalescing ("singleflight") for identical Spotify calls.
+
+Within a process, concurrent callers of the same key share one call. Across
+processes, the first worker to claim a Redis lock performs the call and
+publishes the result; the others poll for it and fall back to making the
+call themselves if it doesn't show up in time.
+"""
+import hashlib
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+
+class _Call:
+    """An in-process call that other threads can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicate identical in-flight calls across threads and workers.
+    """
+
+    def __init__(self, prefix='spotify:inflight'):
+        self.prefix = prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def make_key(self, method, url, params=None):
+        """Key a request on its method, URL and sorted params."""
+        normalized = json.dumps(
+            [method.upper(), url, sorted((str(k), str(v).strip()) for k, v in (params or {}).items())]
+        )
+        return hashlib.md5(normalized.encode()).hexdigest()
+
+    def do(self, key, fn):
+        """Return fn()'s result, sharing it with identical concurrent callers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.event.wait(settings.SPOTIFY_SINGLEFLIGHT_WAIT):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            return fn()
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _do_shared(self, key, fn):
+        lock_key = f'{self.prefix}:lock:{key}'
+        result_key = f'{self.prefix}:result:{key}'
+
+        # Results are wrapped so a legitimate None can be told from a miss
+        published = cache.get(result_key)
+        if published is not None:
+            return published[0]
+
+        if cache.add(lock_key, 1, settings.SPOTIFY_SINGLEFLIGHT_LOCK_TTL):
+            try:
+                result = fn()
+                cache.set(result_key, (result,), settings.SPOTIFY_SINGLEFLIGHT_RESULT_TTL)
+                return result
+            finally:
+                cache.delete(lock_key)
+
+        deadline = time.monotonic() + settings.SPOTIFY_SINGLEFLIGHT_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(settings.SPOTIFY_SINGLEFLIGHT_POLL_INTERVAL)
+            published = cache.get(result_key)
+            if published is not None:
+                return published[0]
+            if not cache.get(lock_key):
+                # The leader finished; check once more in case it published
+                # between the two reads, otherwise it failed.
+                published = cache.get(result_key)
+                if published is not None:
+                    return published[0]
+                break
+
+        return fn()
+
+
+singleflight = SingleFlight()
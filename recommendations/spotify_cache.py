@@ -0,0 +1,161 @@
+"""
+Two-tier cache for Spotify entity lookups.
+
+An in-process LRU sits in front of the shared Redis cache. Both tiers honour
+per-endpoint TTLs from settings.SPOTIFY_CACHE_TTLS, and lookups Spotify
+reports as missing are cached under a short negative TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# Stored in place of None so a cached miss can be told apart from an absent key
+MISS = '__spotify_miss__'
+
+
+class LocalLRU:
+    """
+    Bounded, thread-safe in-process LRU with per-entry expiry.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value) for a live entry."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class EntityCache:
+    """
+    LRU + Redis cache keyed by Spotify endpoint and lookup arguments.
+    """
+    KEY_PREFIX = 'spotify'
+
+    def __init__(self, maxsize=None):
+        self.local = LocalLRU(maxsize or settings.SPOTIFY_LOCAL_CACHE_SIZE)
+        self._counters = Counter()
+        self._counters_lock = threading.Lock()
+
+    def make_key(self, endpoint, parts):
+        digest = hashlib.md5(
+            '|'.join(str(part) for part in parts).encode()
+        ).hexdigest()
+        return f'{self.KEY_PREFIX}:{endpoint}:{digest}'
+
+    def _ttls(self, endpoint, value):
+        """Return (redis_ttl, local_ttl) for a value."""
+        if value == MISS:
+            ttl = settings.SPOTIFY_NEGATIVE_CACHE_TTL
+        else:
+            ttl = settings.SPOTIFY_CACHE_TTLS.get(endpoint, settings.SPOTIFY_DEFAULT_CACHE_TTL)
+        # Keep the local tier short so workers converge on the Redis copy
+        return ttl, min(ttl, settings.SPOTIFY_LOCAL_CACHE_TTL)
+
+    def _count(self, endpoint, outcome):
+        with self._counters_lock:
+            self._counters[(endpoint, outcome)] += 1
+
+    def get(self, endpoint, parts):
+        """
+        Return (found, value). A cached miss is reported as found with None.
+        """
+        key = self.make_key(endpoint, parts)
+
+        found, value = self.local.get(key)
+        if found:
+            self._count(endpoint, 'negative_hits' if value == MISS else 'local_hits')
+            return True, None if value == MISS else value
+
+        value = cache.get(key)
+        if value is not None:
+            self.local.set(key, value, self._ttls(endpoint, value)[1])
+            self._count(endpoint, 'negative_hits' if value == MISS else 'redis_hits')
+            return True, None if value == MISS else value
+
+        self._count(endpoint, 'misses')
+        return False, None
+
+    def set(self, endpoint, parts, value):
+        """Store a value in both tiers; None is stored as a negative entry."""
+        key = self.make_key(endpoint, parts)
+        stored = MISS if value is None else value
+        redis_ttl, local_ttl = self._ttls(endpoint, stored)
+        cache.set(key, stored, redis_ttl)
+        self.local.set(key, stored, local_ttl)
+
+    def get_or_fetch(self, endpoint, parts, fetch):
+        """
+        Return the cached value or call fetch() and cache its result.
+
+        fetch() returns the value, or None when Spotify reports the entity
+        as missing. Exceptions propagate and nothing is cached.
+        """
+        found, value = self.get(endpoint, parts)
+        if found:
+            return value
+        value = fetch()
+        self.set(endpoint, parts, value)
+        return value
+
+    async def aget(self, endpoint, parts):
+        """Async get(); only a trip to the Redis tier leaves the event loop."""
+        if self.local.get(self.make_key(endpoint, parts))[0]:
+            return self.get(endpoint, parts)
+        return await sync_to_async(self.get, thread_sensitive=False)(endpoint, parts)
+
+    async def aset(self, endpoint, parts, value):
+        await sync_to_async(self.set, thread_sensitive=False)(endpoint, parts, value)
+
+    def stats(self):
+        """Return hit/miss counters per endpoint for this process."""
+        with self._counters_lock:
+            counters = dict(self._counters)
+        stats = {}
+        for (endpoint, outcome), count in counters.items():
+            stats.setdefault(endpoint, {})[outcome] = count
+        for endpoint_stats in stats.values():
+            lookups = sum(endpoint_stats.values())
+            hits = lookups - endpoint_stats.get('misses', 0)
+            endpoint_stats['hit_ratio'] = round(hits / lookups, 3) if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._counters_lock:
+            self._counters.clear()
+
+
+entity_cache = EntityCache()
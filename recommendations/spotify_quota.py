@@ -0,0 +1,223 @@
+"""
+Global Spotify request quota shared by every worker.
+
+A token bucket in Redis refills at SPOTIFY_QUOTA_RATE requests per second up
+to SPOTIFY_QUOTA_BURST. Requests are drawn from one of two lanes:
+interactive (user-triggered refreshes) may drain the bucket, while the
+background sweep must leave SPOTIFY_QUOTA_INTERACTIVE_RESERVE tokens behind,
+so user requests keep flowing when the sweep saturates the quota.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+LANES = (INTERACTIVE, BACKGROUND)
+
+# Returns the seconds to wait before a token is available, or 0 once granted.
+# Uses the Redis clock so workers with skewed clocks share one timeline.
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+else
+    wait = (reserve + 1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+
+class SpotifyQuotaExceeded(requests.RequestException):
+    """Raised when no quota frees up within the lane's wait timeout."""
+
+
+class RedisTokenBucket:
+    """Token bucket shared by all processes through a Lua script."""
+
+    def __init__(self, client, key):
+        self.key = key
+        self.script = client.register_script(TAKE_TOKEN_SCRIPT)
+
+    def take(self, rate, burst, reserve):
+        return float(self.script(keys=[self.key], args=[rate, burst, reserve]))
+
+
+class LocalTokenBucket:
+    """In-process bucket for cache backends without raw Redis access."""
+
+    def __init__(self):
+        self._tokens = None
+        self._ts = None
+        self._lock = threading.Lock()
+
+    def take(self, rate, burst, reserve):
+        with self._lock:
+            now = time.monotonic()
+            if self._tokens is None:
+                self._tokens, self._ts = burst, now
+            self._tokens = min(burst, self._tokens + max(0, now - self._ts) * rate)
+            self._ts = now
+            if self._tokens - 1 >= reserve:
+                self._tokens -= 1
+                return 0.0
+            return (reserve + 1 - self._tokens) / rate
+
+
+class SpotifyQuota:
+    """
+    Priority-aware limiter all SpotifyService instances draw from.
+    """
+    METRICS_PREFIX = 'spotify:quota:metrics'
+
+    def __init__(self):
+        self._bucket = None
+        self._bucket_lock = threading.Lock()
+        # Metrics are summed in-process and written every
+        # SPOTIFY_QUOTA_METRICS_FLUSH_INTERVAL seconds, not once per request
+        self._pending = Counter()
+        self._pending_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._bucket_lock:
+                if self._bucket is None:
+                    self._bucket = self._build_bucket()
+        return self._bucket
+
+    def _build_bucket(self):
+        try:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+        except (ImportError, NotImplementedError):
+            logger.warning("Cache backend has no Redis client; Spotify quota is per-process")
+            return LocalTokenBucket()
+        return RedisTokenBucket(client, cache.make_key('spotify:quota:bucket'))
+
+    def acquire(self, lane=BACKGROUND):
+        """
+        Block until the lane may make one Spotify request.
+
+        Raises SpotifyQuotaExceeded if that would take longer than the lane's
+        timeout in SPOTIFY_QUOTA_WAIT_TIMEOUTS.
+        """
+        if not settings.SPOTIFY_QUOTA_ENABLED:
+            return
+        lane, reserve, started, deadline = self._start(lane)
+        while True:
+            wait = self.bucket.take(
+                settings.SPOTIFY_QUOTA_RATE, settings.SPOTIFY_QUOTA_BURST, reserve
+            )
+            if wait <= 0:
+                self._granted(lane, started)
+                return
+            if time.monotonic() + wait > deadline:
+                raise self._rejected(lane)
+            time.sleep(wait)
+
+    async def aacquire(self, lane=BACKGROUND):
+        """Async acquire(); waits without blocking the event loop."""
+        if not settings.SPOTIFY_QUOTA_ENABLED:
+            return
+        lane, reserve, started, deadline = self._start(lane)
+        take = sync_to_async(self.bucket.take, thread_sensitive=False)
+        while True:
+            wait = await take(
+                settings.SPOTIFY_QUOTA_RATE, settings.SPOTIFY_QUOTA_BURST, reserve
+            )
+            if wait <= 0:
+                await sync_to_async(self._granted, thread_sensitive=False)(lane, started)
+                return
+            if time.monotonic() + wait > deadline:
+                raise await sync_to_async(self._rejected, thread_sensitive=False)(lane)
+            await asyncio.sleep(wait)
+
+    def _start(self, lane):
+        if lane not in LANES:
+            lane = BACKGROUND
+        reserve = settings.SPOTIFY_QUOTA_INTERACTIVE_RESERVE if lane == BACKGROUND else 0
+        started = time.monotonic()
+        deadline = started + settings.SPOTIFY_QUOTA_WAIT_TIMEOUTS[lane]
+        return lane, reserve, started, deadline
+
+    def _granted(self, lane, started):
+        waited_ms = int((time.monotonic() - started) * 1000)
+        self._record(lane, granted=1, waited=1 if waited_ms else 0, wait_ms=waited_ms)
+
+    def _rejected(self, lane):
+        self._record(lane, rejected=1)
+        return SpotifyQuotaExceeded(f"Spotify quota exhausted for {lane} requests")
+
+    def _record(self, lane, **deltas):
+        with self._pending_lock:
+            for name, delta in deltas.items():
+                if delta:
+                    self._pending[f'{self.METRICS_PREFIX}:{lane}:{name}'] += delta
+            due = time.monotonic() - self._flushed_at >= settings.SPOTIFY_QUOTA_METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush_metrics()
+
+    def flush_metrics(self):
+        """Write this process's pending metric counts to the shared cache."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        for key, delta in pending.items():
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                cache.add(key, 0, None)
+                cache.incr(key, delta)
+
+    def metrics(self):
+        """
+        Return granted/rejected counts and wait times per lane.
+
+        Other processes' counts may lag by up to
+        SPOTIFY_QUOTA_METRICS_FLUSH_INTERVAL seconds.
+        """
+        self.flush_metrics()
+        names = ('granted', 'rejected', 'waited', 'wait_ms')
+        keys = [f'{self.METRICS_PREFIX}:{lane}:{name}' for lane in LANES for name in names]
+        values = cache.get_many(keys)
+        metrics = {}
+        for lane in LANES:
+            lane_metrics = {
+                name: values.get(f'{self.METRICS_PREFIX}:{lane}:{name}', 0) for name in names
+            }
+            granted = lane_metrics['granted']
+            lane_metrics['avg_wait_ms'] = round(lane_metrics['wait_ms'] / granted, 1) if granted else 0.0
+            metrics[lane] = lane_metrics
+        return metrics
+
+    def reset_metrics(self):
+        with self._pending_lock:
+            self._pending.clear()
+        cache.delete_many([
+            f'{self.METRICS_PREFIX}:{lane}:{name}'
+            for lane in LANES for name in ('granted', 'rejected', 'waited', 'wait_ms')
+        ])
+
+
+spotify_quota = SpotifyQuota()
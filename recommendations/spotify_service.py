@@ -1,14 +1,408 @@
 """
 Spotify API integration service.
 """
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
 import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 from django.core.cache import cache
+from .circuit_breaker import spotify_breaker
+from .models import ArtistNameIndex
+from .spotify_cache import entity_cache
+from .singleflight import singleflight
+from .spotify_quota import BACKGROUND, spotify_quota
 import logging
 
 logger = logging.getLogger(__name__)
 
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+SPOTIFY_ID_RE = re.compile(r'^[0-9A-Za-z]{22}$')
+
+# Maximum IDs accepted by Spotify's /tracks and /artists multi-ID endpoints
+BATCH_SIZE = 50
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def retry_delay(response, attempt):
+    """
+    Seconds to wait before retry number attempt: Spotify's Retry-After when
+    given, capped so a single call can't park a worker for minutes, else
+    jittered exponential backoff.
+    """
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), settings.SPOTIFY_MAX_RETRY_AFTER)
+    return settings.SPOTIFY_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1)
+
+
+def build_session():
+    """
+    Build a pooled, keep-alive session.
+
+    The adapter only retries failed connections, which never reach Spotify.
+    Retries of 429/5xx responses happen in SpotifyService._request so each
+    attempt draws from the quota and is seen by the circuit breaker.
+    """
+    retry = Retry(
+        total=settings.SPOTIFY_MAX_RETRIES,
+        connect=settings.SPOTIFY_MAX_RETRIES,
+        read=False,
+        status=False,
+        backoff_factor=settings.SPOTIFY_RETRY_BACKOFF,
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=settings.SPOTIFY_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the per-process Spotify session.
+
+    The session is rebuilt after a fork so Celery prefork children never
+    share sockets with their parent.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = build_session()
+                _session_pid = pid
+    return _session
+
+
+def get_executor():
+    """
+    Return the per-process thread pool for concurrent Spotify lookups.
+
+    Like get_session(), the pool is rebuilt after a fork: worker threads
+    don't survive into Celery prefork children.
+    """
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.SPOTIFY_FANOUT_WORKERS,
+                    thread_name_prefix='spotify-fanout'
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def is_upstream_failure(status_code):
+    """Whether a final status counts against the circuit breaker."""
+    return status_code == 429 or status_code >= 500
+
+
+def split_artist_identifiers(identifiers):
+    """
+    Split seed artists into ({id: id} for Spotify IDs, {normalized: name}
+    for names that still need resolving).
+    """
+    resolved = {}
+    names = {}
+    for identifier in identifiers:
+        if SPOTIFY_ID_RE.match(identifier):
+            resolved[identifier] = identifier
+        else:
+            names.setdefault(ArtistNameIndex.normalize(identifier), identifier)
+    return resolved, names
+
+
+def merge_artist_resolutions(identifiers, resolved, known):
+    """Map each identifier to its ID using {normalized: artist_id} answers."""
+    for identifier in identifiers:
+        if identifier not in resolved:
+            normalized = ArtistNameIndex.normalize(identifier)
+            if normalized in known:
+                resolved[identifier] = known[normalized]
+    return resolved
+
+
+def first_artist_id(search_result):
+    """ID of the top hit in an artist search payload, if any."""
+    if search_result and search_result.get('artists', {}).get('items'):
+        return search_result['artists']['items'][0]['id']
+    return None
+
+
+def _project_urls(entity):
+    urls = entity.get('external_urls') or {}
+    return {'spotify': urls['spotify']} if 'spotify' in urls else {}
+
+
+def project_artist(artist):
+    """
+    Keep only the artist fields the app serves or reasons about.
+    
+    Simplified artist objects (inside tracks) have no genres, images or
+    popularity; those keys are only kept when present.
+    """
+    if not artist:
+        return artist
+    projected = {
+        'id': artist.get('id'),
+        'name': artist.get('name'),
+        'external_urls': _project_urls(artist),
+    }
+    for field in ('genres', 'images', 'popularity'):
+        if field in artist:
+            projected[field] = artist[field]
+    return projected
+
+
+def project_track(track):
+    """
+    Keep only the track fields the app serves, dropping available_markets,
+    external IDs and the rest of the album payload.
+    """
+    if not track:
+        return track
+    album = track.get('album') or {}
+    return {
+        'id': track.get('id'),
+        'name': track.get('name'),
+        'artists': [
+            {'id': artist.get('id'), 'name': artist.get('name'), 'external_urls': _project_urls(artist)}
+            for artist in track.get('artists') or []
+        ],
+        'album': {
+            'id': album.get('id'),
+            'name': album.get('name', ''),
+            'images': album.get('images') or [],
+            'release_date': album.get('release_date', ''),
+            'external_urls': _project_urls(album),
+        },
+        'duration_ms': track.get('duration_ms', 0),
+        'popularity': track.get('popularity', 0),
+        'preview_url': track.get('preview_url'),
+        'external_urls': _project_urls(track),
+    }
+
+
+def project_payload(data):
+    """
+    Project a decoded Spotify response right after parsing.
+    
+    Handles single tracks and artists, the multi-ID and top-tracks lists,
+    and search pages. Anything else is returned untouched.
+    """
+    if not isinstance(data, dict):
+        return data
+    if data.get('type') == 'track':
+        return project_track(data)
+    if data.get('type') == 'artist':
+        return project_artist(data)
+    projected = dict(data)
+    for key, project in (('tracks', project_track), ('artists', project_artist)):
+        value = data.get(key)
+        if isinstance(value, list):
+            projected[key] = [project(item) for item in value]
+        elif isinstance(value, dict) and 'items' in value:
+            projected[key] = {**value, 'items': [project(item) for item in value['items']]}
+    return projected
+
+
+def seed_signature(seed_genres=None, seed_artists=None, seed_tracks=None, limit=20):
+    """
+    Order- and case-insensitive key for the seeds get_recommendations uses.
+    
+    Only the seeds it actually reads count (3 genres, 2 artists, 2 tracks),
+    so users whose lists differ past that point still share a result.
+    Artist names are normalized like ArtistNameIndex; IDs are kept as is.
+    """
+    genres = sorted({genre.strip().lower() for genre in (seed_genres or [])[:3]})
+    artists = sorted({
+        artist if SPOTIFY_ID_RE.match(artist) else ArtistNameIndex.normalize(artist)
+        for artist in (seed_artists or [])[:2]
+    })
+    tracks = sorted(set((seed_tracks or [])[:2]))
+    return (','.join(genres), ','.join(artists), ','.join(tracks), limit)
+
+
+def dedupe_tracks(tracks, limit):
+    """Drop repeated track IDs, keeping first occurrences, up to limit."""
+    seen = set()
+    unique_tracks = []
+    for track in tracks:
+        if track['id'] not in seen:
+            seen.add(track['id'])
+            unique_tracks.append(track)
+            if len(unique_tracks) >= limit:
+                break
+    return unique_tracks
+
+
+class SpotifyTokenManager:
+    """
+    Process-wide holder for the client-credentials access token.
+    
+    The token and its expiry live in memory, so API calls don't touch Redis.
+    Redis is only consulted when the in-process token is missing or stale,
+    and renewals are guarded by a distributed lock so exactly one process
+    posts to the accounts service; the others pick the new token up from
+    Redis. A background timer renews the token shortly before it expires.
+    """
+    CACHE_KEY = 'spotify_token'
+    LOCK_KEY = 'spotify_token_lock'
+    
+    def __init__(self):
+        self._token = None
+        self._expires_at = 0
+        self._fetch = None
+        self._lock = threading.Lock()
+        self._timer = None
+        self._timer_pid = None
+        # Consecutive failed background renewals, for backoff
+        self._failures = 0
+    
+    def _is_fresh(self, expires_at):
+        return expires_at - settings.SPOTIFY_TOKEN_EXPIRY_MARGIN > time.time()
+    
+    def get_token(self, fetch):
+        """
+        Return a valid token. fetch() requests a new one from Spotify and
+        returns (access_token, expires_in).
+        """
+        self._fetch = fetch
+        if self._token and self._is_fresh(self._expires_at):
+            self._ensure_timer()
+            return self._token
+        
+        with self._lock:
+            if not (self._token and self._is_fresh(self._expires_at)):
+                self._renew(stale_token=self._token)
+            self._ensure_timer()
+            return self._token
+    
+    def peek(self):
+        """Return the in-process token if still fresh, without renewing."""
+        if self._token and self._is_fresh(self._expires_at):
+            return self._token
+        return None
+    
+    def invalidate(self, token):
+        """Drop a token Spotify rejected, here and in Redis."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0
+        entry = cache.get(self.CACHE_KEY)
+        if entry and entry['token'] == token:
+            cache.delete(self.CACHE_KEY)
+    
+    def _adopt(self, entry):
+        self._token = entry['token']
+        self._expires_at = entry['expires_at']
+    
+    def _renew(self, stale_token=None):
+        """Adopt a newer token from Redis or, holding the lock, fetch one."""
+        entry = cache.get(self.CACHE_KEY)
+        if entry and entry['token'] != stale_token and self._is_fresh(entry['expires_at']):
+            self._adopt(entry)
+            return
+        
+        if cache.add(self.LOCK_KEY, os.getpid(), settings.SPOTIFY_TOKEN_LOCK_TTL):
+            try:
+                access_token, expires_in = self._fetch()
+                entry = {'token': access_token, 'expires_at': time.time() + expires_in}
+                cache.set(self.CACHE_KEY, entry, expires_in)
+                self._adopt(entry)
+                return
+            finally:
+                cache.delete(self.LOCK_KEY)
+        
+        # Another process is renewing; wait for it to publish
+        deadline = time.monotonic() + settings.SPOTIFY_TOKEN_LOCK_TTL
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            entry = cache.get(self.CACHE_KEY)
+            if entry and entry['token'] != stale_token and self._is_fresh(entry['expires_at']):
+                self._adopt(entry)
+                return
+            if not cache.get(self.LOCK_KEY):
+                break
+        
+        # The other renewal failed or stalled; fetch directly rather than fail
+        access_token, expires_in = self._fetch()
+        entry = {'token': access_token, 'expires_at': time.time() + expires_in}
+        cache.set(self.CACHE_KEY, entry, expires_in)
+        self._adopt(entry)
+    
+    def _ensure_timer(self):
+        """Schedule the background renewal once per process and token."""
+        if self._timer_pid == os.getpid() and self._timer is not None and self._timer.is_alive():
+            return
+        # Jitter so processes don't all wake at the same instant
+        delay = (
+            self._expires_at - time.time()
+            - settings.SPOTIFY_TOKEN_REFRESH_AHEAD
+            - random.uniform(0, settings.SPOTIFY_TOKEN_REFRESH_AHEAD / 4)
+        )
+        self._start_timer(max(delay, 1))
+    
+    def _start_timer(self, delay):
+        self._timer = threading.Timer(delay, self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer_pid = os.getpid()
+        self._timer.start()
+    
+    def _refresh_in_background(self):
+        # An expired token is renewed by the next get_token() instead, so an
+        # accounts-service outage doesn't keep every process polling it
+        if self._expires_at <= time.time():
+            self._timer = None
+            return
+        try:
+            with self._lock:
+                # Skip if the token was already replaced (e.g. after a 401)
+                remaining = self._expires_at - time.time()
+                if remaining <= settings.SPOTIFY_TOKEN_REFRESH_AHEAD * 1.25 + 1:
+                    self._renew(stale_token=self._token)
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            logger.error(f"Error refreshing Spotify access token: {str(e)}")
+        finally:
+            self._timer = None
+            if self._failures:
+                backoff = min(
+                    settings.SPOTIFY_TOKEN_RETRY_BACKOFF * 2 ** (self._failures - 1),
+                    settings.SPOTIFY_TOKEN_RETRY_MAX_BACKOFF,
+                )
+                self._start_timer(backoff * random.uniform(0.5, 1))
+            elif self._token:
+                self._ensure_timer()
+
+
+token_manager = SpotifyTokenManager()
+
 
 class SpotifyService:
     """
@@ -17,20 +411,27 @@ class SpotifyService:
     BASE_URL = 'https://api.spotify.com/v1'
     AUTH_URL = 'https://accounts.spotify.com/api/token'
     
-    def __init__(self):
+    def __init__(self, priority=BACKGROUND):
+        # Overridable so the service can point at the local stand-in server
+        self.BASE_URL = settings.SPOTIFY_API_BASE_URL
+        self.AUTH_URL = settings.SPOTIFY_AUTH_URL
         self.client_id = settings.SPOTIFY_CLIENT_ID
         self.client_secret = settings.SPOTIFY_CLIENT_SECRET
         self._access_token = None
+        self.session = get_session()
+        self.timeout = (settings.SPOTIFY_CONNECT_TIMEOUT, settings.SPOTIFY_READ_TIMEOUT)
+        # Quota lane: 'interactive' for user-triggered work, 'background' otherwise
+        self.priority = priority
     
     def _get_access_token(self):
         """
         Get access token using client credentials flow.
-        Cache the token for its lifetime.
+        The token is held in-process and renewed by SpotifyTokenManager.
         """
-        cached_token = cache.get('spotify_access_token')
-        if cached_token:
-            return cached_token
-        
+        return token_manager.get_token(self._request_access_token)
+    
+    def _request_access_token(self):
+        """Request a new token. Returns (access_token, expires_in)."""
         # Encode credentials
         credentials = f"{self.client_id}:{self.client_secret}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
@@ -43,29 +444,97 @@ class SpotifyService:
         data = {'grant_type': 'client_credentials'}
         
         try:
-            response = requests.post(self.AUTH_URL, headers=headers, data=data)
+            response = self.session.post(self.AUTH_URL, headers=headers, data=data, timeout=self.timeout)
             response.raise_for_status()
             token_data = response.json()
             
-            access_token = token_data['access_token']
-            expires_in = token_data.get('expires_in', 3600)
-            
-            # Cache the token for its lifetime minus 5 minutes for safety
-            cache.set('spotify_access_token', access_token, expires_in - 300)
-            
-            return access_token
+            return token_data['access_token'], token_data.get('expires_in', 3600)
         except requests.RequestException as e:
             logger.error(f"Error getting Spotify access token: {str(e)}")
             raise
     
-    def _get_headers(self):
+    def _get_headers(self, token=None):
         """Get headers with authorization token."""
-        token = self._get_access_token()
+        token = token or self._get_access_token()
         return {
             'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json'
         }
     
+    def _request(self, method, url, **kwargs):
+        """
+        Perform an authorized request through the pooled session.
+        
+        Raises requests.RequestException on transport errors or a non-2xx
+        status once retries are exhausted. 429/5xx responses and read
+        timeouts are retried up to SPOTIFY_MAX_RETRIES times, honouring
+        Retry-After. A 401 invalidates the token and the request is retried
+        once with a fresh one. Every attempt first draws from the shared
+        Spotify quota in this service's lane, and fails fast with
+        SpotifyUnavailable while the circuit breaker is open.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        token_renewed = False
+        attempt = 0
+        while True:
+            probe = spotify_breaker.before_call()
+            try:
+                token = self._get_access_token()
+                spotify_quota.acquire(self.priority)
+            except Exception:
+                spotify_breaker.release_probe(probe)
+                raise
+            try:
+                response = self.session.request(
+                    method, url, headers=self._get_headers(token), **kwargs
+                )
+            except requests.RequestException as e:
+                spotify_breaker.record_failure(probe)
+                if not isinstance(e, requests.ReadTimeout) or attempt >= settings.SPOTIFY_MAX_RETRIES:
+                    raise
+                time.sleep(retry_delay(None, attempt))
+                attempt += 1
+                continue
+            
+            if is_upstream_failure(response.status_code):
+                spotify_breaker.record_failure(probe)
+            else:
+                spotify_breaker.record_success(probe)
+            
+            if response.status_code == 401 and not token_renewed:
+                logger.warning("Spotify rejected the access token; renewing")
+                token_manager.invalidate(token)
+                token_renewed = True
+                continue
+            if response.status_code in RETRY_STATUS_CODES and attempt < settings.SPOTIFY_MAX_RETRIES:
+                time.sleep(retry_delay(response, attempt))
+                attempt += 1
+                continue
+            
+            response.raise_for_status()
+            return response
+    
+    def _get_json(self, url, params=None):
+        """
+        GET a Spotify resource and decode it.
+        
+        Returns None when Spotify reports the resource as missing (400/404)
+        so callers can negative-cache it; other failures raise. Identical
+        concurrent calls from any worker are coalesced into one request.
+        """
+        key = singleflight.make_key('GET', url, params)
+        return singleflight.do(key, lambda: self._fetch_json(url, params))
+    
+    def _fetch_json(self, url, params=None):
+        """Uncoalesced body of _get_json."""
+        try:
+            response = self._request('GET', url, params=params)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in (400, 404):
+                return None
+            raise
+        return project_payload(response.json())
+    
     def search_tracks(self, query, limit=20):
         """
         Search for tracks on Spotify.
@@ -78,9 +547,7 @@ class SpotifyService:
         }
         
         try:
-            response = requests.get(url, headers=self._get_headers(), params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._get_json(url, params=params)
         except requests.RequestException as e:
             logger.error(f"Error searching tracks: {str(e)}")
             return None
@@ -103,95 +570,252 @@ class SpotifyService:
         recommendations = []
         
         try:
+            # Map seed artist names to IDs through the shared index (this runs
+            # in the calling thread so the fan-out threads never touch the DB)
+            artists = (seed_artists or [])[:2]
+            artist_ids = self.resolve_artist_ids(artists)
+            
+            # Resolve every seed artist and seed track in one batch call each;
+            # the per-seed lookups below are then served from the entity cache.
+            collector = SpotifyEntityCollector(self)
+            collector.add_artists(artist_ids.values())
+            collector.add_tracks((seed_tracks or [])[:2])
+            collector.resolve()
+            
+            # Each job is independent; results are merged in job order so the
+            # dedupe below sees tracks in the same order as a sequential run.
+            jobs = []
+            
             # Strategy 1: Search by genres
             if seed_genres:
-                for genre in seed_genres[:3]:
-                    query = f"genre:{genre}"
-                    tracks = self._search_tracks_for_recommendations(query, limit=limit//len(seed_genres[:3]))
-                    recommendations.extend(tracks)
+                genres = seed_genres[:3]
+                for genre in genres:
+                    jobs.append((
+                        self._search_tracks_for_recommendations,
+                        (f"genre:{genre}", limit//len(genres))
+                    ))
             
             # Strategy 2: Get artist's top tracks and related artists
             if seed_artists:
-                for artist_identifier in seed_artists[:2]:
-                    # Check if it's an artist ID or name
-                    if len(artist_identifier) == 22:  # Spotify ID length
-                        artist_id = artist_identifier
-                    else:
-                        # Search for artist by name
-                        artist_result = self.search_artists(artist_identifier, limit=1)
-                        if artist_result and artist_result.get('artists', {}).get('items'):
-                            artist_id = artist_result['artists']['items'][0]['id']
-                        else:
-                            continue
-                    
-                    # Get artist's top tracks
-                    top_tracks = self.get_artist_top_tracks(artist_id)
-                    if top_tracks:
-                        recommendations.extend(top_tracks[:limit//len(seed_artists[:2])])
-                    
-                    # Also search for similar artists by genre (related-artists endpoint is restricted)
-                    artist_info = self.get_artist(artist_id)
-                    if artist_info and artist_info.get('genres'):
-                        genre = artist_info['genres'][0] if artist_info['genres'] else None
-                        if genre:
-                            similar_tracks = self._search_tracks_for_recommendations(
-                                f"genre:{genre}",
-                                limit=3
-                            )
-                            recommendations.extend(similar_tracks)
+                for artist_identifier in artists:
+                    if artist_identifier not in artist_ids:
+                        continue
+                    jobs.append((
+                        self._artist_recommendations,
+                        (artist_ids[artist_identifier], limit//len(artists))
+                    ))
             
             # Strategy 3: Use seed tracks to find similar
             if seed_tracks:
                 for track_id in seed_tracks[:2]:
-                    track = self.get_track(track_id)
-                    if track:
-                        # Search for similar tracks by artist and genre
-                        artist_name = track['artists'][0]['name']
-                        similar = self._search_tracks_for_recommendations(
-                            f"artist:{artist_name}", 
-                            limit=3
-                        )
-                        recommendations.extend(similar)
+                    jobs.append((self._track_recommendations, (track_id,)))
+            
+            for tracks in self._run_concurrently(jobs):
+                recommendations.extend(tracks)
             
             # If no seeds provided, get popular tracks
             if not recommendations:
                 recommendations = self._search_tracks_for_recommendations("year:2023-2025", limit=limit)
             
             # Remove duplicates and limit
-            seen = set()
-            unique_recommendations = []
-            for track in recommendations:
-                if track['id'] not in seen:
-                    seen.add(track['id'])
-                    unique_recommendations.append(track)
-                    if len(unique_recommendations) >= limit:
-                        break
-            
             return {
-                'tracks': unique_recommendations[:limit]
+                'tracks': dedupe_tracks(recommendations, limit)
             }
             
         except Exception as e:
             logger.error(f"Error getting recommendations: {str(e)}")
             return None
     
+    def get_shared_recommendations(self, seed_genres=None, seed_artists=None, seed_tracks=None,
+                                   limit=20):
+        """
+        get_recommendations() shared by every caller with the same seeds.
+        
+        Results are cached under seed_signature() for
+        SPOTIFY_CACHE_TTLS['recommendations'], and identical concurrent
+        computations in any worker are coalesced, so Spotify traffic scales
+        with distinct seed sets rather than users. Failed or empty results
+        are not cached.
+        """
+        parts = seed_signature(seed_genres, seed_artists, seed_tracks, limit)
+        found, result = entity_cache.get('recommendations', parts)
+        if found and result:
+            return result
+        
+        def compute():
+            result = self.get_recommendations(
+                seed_genres=seed_genres,
+                seed_artists=seed_artists,
+                seed_tracks=seed_tracks,
+                limit=limit
+            )
+            if result and result.get('tracks'):
+                entity_cache.set('recommendations', parts, result)
+            return result
+        
+        return singleflight.do(entity_cache.make_key('recommendations', parts), compute)
+    
+    def resolve_artist_ids(self, identifiers):
+        """
+        Map seed artist names or IDs to Spotify artist IDs.
+        
+        IDs pass through unchanged. Names are looked up in ArtistNameIndex
+        and only unknown names are searched on Spotify; their answers are
+        added to the index. Names that can't be resolved are left out.
+        """
+        resolved, names = split_artist_identifiers(identifiers)
+        if not names:
+            return resolved
+        
+        known = ArtistNameIndex.lookup(names)
+        unknown = [normalized for normalized in names if normalized not in known]
+        
+        def search(name):
+            artist_id = first_artist_id(self.search_artists(name, limit=1))
+            return [artist_id] if artist_id else []
+        
+        new_entries = []
+        found = self._run_concurrently([(search, (names[n],)) for n in unknown])
+        for normalized, artist_ids in zip(unknown, found):
+            if artist_ids:
+                known[normalized] = artist_ids[0]
+                new_entries.append((names[normalized], artist_ids[0]))
+        if new_entries:
+            ArtistNameIndex.remember(new_entries)
+        
+        return merge_artist_resolutions(identifiers, resolved, known)
+    
+    def _artist_recommendations(self, artist_id, limit):
+        """Top tracks plus same-genre tracks for a seed artist."""
+        recommendations = []
+        
+        # Get artist's top tracks
+        top_tracks = self.get_artist_top_tracks(artist_id)
+        if top_tracks:
+            recommendations.extend(top_tracks[:limit])
+        
+        # Also search for similar artists by genre (related-artists endpoint is restricted)
+        artist_info = self.get_artist(artist_id)
+        if artist_info and artist_info.get('genres'):
+            genre = artist_info['genres'][0]
+            similar_tracks = self._search_tracks_for_recommendations(
+                f"genre:{genre}",
+                limit=3
+            )
+            recommendations.extend(similar_tracks)
+        
+        return recommendations
+    
+    def _track_recommendations(self, track_id):
+        """Tracks by the same artist as a seed track."""
+        track = self.get_track(track_id)
+        if not track:
+            return []
+        
+        # Search for similar tracks by artist and genre
+        artist_name = track['artists'][0]['name']
+        return self._search_tracks_for_recommendations(
+            f"artist:{artist_name}", 
+            limit=3
+        )
+    
+    def _run_concurrently(self, jobs):
+        """
+        Run (func, args) jobs on the process's shared pool, each under
+        SPOTIFY_RECOMMENDATIONS_DEADLINE from when it starts running.
+        
+        Time spent queued behind other callers' jobs doesn't count against a
+        job, but a job that gets no worker within one deadline is dropped
+        (and logged as queue-starved). Returns one track list per job, in job
+        order. Jobs that fail, miss their deadline or are dropped contribute
+        an empty list.
+        """
+        if not jobs:
+            return []
+        
+        deadline = settings.SPOTIFY_RECOMMENDATIONS_DEADLINE
+        started = {}
+        
+        def run(index, func, args):
+            started[index] = time.monotonic()
+            return func(*args)
+        
+        submitted = time.monotonic()
+        futures = [get_executor().submit(run, index, func, args) for index, (func, args) in enumerate(jobs)]
+        pending = dict(enumerate(futures))
+        slow, starved = [], []
+        while pending:
+            now = time.monotonic()
+            expires = {index: started.get(index, submitted) + deadline for index in pending}
+            for index, expires_at in expires.items():
+                if expires_at <= now:
+                    (slow if index in started else starved).append(pending.pop(index))
+            if not pending:
+                break
+            done, _ = wait(
+                pending.values(), timeout=min(expires[index] for index in pending) - now,
+                return_when=FIRST_COMPLETED,
+            )
+            pending = {index: future for index, future in pending.items() if future not in done}
+        
+        if slow:
+            logger.warning(f"{len(slow)} of {len(futures)} Spotify lookups missed the {deadline}s deadline")
+        if starved:
+            logger.warning(
+                f"{len(starved)} of {len(futures)} Spotify lookups waited over {deadline}s for a "
+                f"fan-out worker (SPOTIFY_FANOUT_WORKERS={settings.SPOTIFY_FANOUT_WORKERS})"
+            )
+            # Free the shared pool of queued jobs; their results would be discarded anyway
+            for future in starved:
+                future.cancel()
+        
+        dropped = set(slow) | set(starved)
+        results = []
+        for future in futures:
+            if future in dropped:
+                results.append([])
+                continue
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Error in recommendation lookup: {str(e)}")
+                results.append([])
+        return results
+    
     def _search_tracks_for_recommendations(self, query, limit=10):
         """Helper method to search and format tracks for recommendations."""
-        result = self.search_tracks(query, limit=limit)
-        if result and result.get('tracks', {}).get('items'):
-            return result['tracks']['items']
-        return []
+        url = f"{self.BASE_URL}/search"
+        params = {
+            'q': query,
+            'type': 'track',
+            'limit': limit
+        }
+        
+        def fetch():
+            result = self._get_json(url, params=params)
+            if result and result.get('tracks', {}).get('items'):
+                return result['tracks']['items']
+            return None
+        
+        try:
+            return entity_cache.get_or_fetch(
+                'search_tracks', (query.strip().lower(), limit), fetch
+            ) or []
+        except requests.RequestException as e:
+            logger.error(f"Error searching tracks: {str(e)}")
+            return []
     
     def get_artist_top_tracks(self, artist_id, market='US'):
         """Get an artist's top tracks."""
         url = f"{self.BASE_URL}/artists/{artist_id}/top-tracks"
         params = {'market': market}
         
+        def fetch():
+            data = self._get_json(url, params=params)
+            return (data or {}).get('tracks') or None
+        
         try:
-            response = requests.get(url, headers=self._get_headers(), params=params)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('tracks', [])
+            return entity_cache.get_or_fetch('top_tracks', (artist_id, market), fetch) or []
         except requests.RequestException as e:
             logger.error(f"Error getting artist top tracks: {str(e)}")
             return []
@@ -201,9 +825,8 @@ class SpotifyService:
         url = f"{self.BASE_URL}/artists/{artist_id}/related-artists"
         
         try:
-            response = requests.get(url, headers=self._get_headers())
-            response.raise_for_status()
-            data = response.json()
+            response = self._request('GET', url)
+            data = project_payload(response.json())
             return data.get('artists', [])[:5]
         except requests.RequestException as e:
             logger.error(f"Error getting related artists: {str(e)}")
@@ -216,8 +839,7 @@ class SpotifyService:
         url = f"{self.BASE_URL}/recommendations/available-genre-seeds"
         
         try:
-            response = requests.get(url, headers=self._get_headers())
-            response.raise_for_status()
+            response = self._request('GET', url)
             return response.json().get('genres', [])
         except requests.RequestException as e:
             logger.error(f"Error getting genre seeds: {str(e)}")
@@ -234,10 +856,16 @@ class SpotifyService:
             'limit': limit
         }
         
+        def fetch():
+            result = self._get_json(url, params=params)
+            if result and result.get('artists', {}).get('items'):
+                return result
+            return None
+        
         try:
-            response = requests.get(url, headers=self._get_headers(), params=params)
-            response.raise_for_status()
-            return response.json()
+            return entity_cache.get_or_fetch(
+                'search_artists', (query.strip().lower(), limit), fetch
+            )
         except requests.RequestException as e:
             logger.error(f"Error searching artists: {str(e)}")
             return None
@@ -249,9 +877,9 @@ class SpotifyService:
         url = f"{self.BASE_URL}/artists/{artist_id}"
         
         try:
-            response = requests.get(url, headers=self._get_headers())
-            response.raise_for_status()
-            return response.json()
+            return entity_cache.get_or_fetch(
+                'artist', (artist_id,), lambda: self._get_json(url)
+            )
         except requests.RequestException as e:
             logger.error(f"Error getting artist: {str(e)}")
             return None
@@ -263,9 +891,107 @@ class SpotifyService:
         url = f"{self.BASE_URL}/tracks/{track_id}"
         
         try:
-            response = requests.get(url, headers=self._get_headers())
-            response.raise_for_status()
-            return response.json()
+            return entity_cache.get_or_fetch(
+                'track', (track_id,), lambda: self._get_json(url)
+            )
         except requests.RequestException as e:
             logger.error(f"Error getting track: {str(e)}")
             return None
+    
+    def get_tracks(self, track_ids):
+        """
+        Get many tracks by ID using the multi-ID /tracks endpoint.
+        
+        Returns a dict of track ID to track (None for unknown IDs). IDs that
+        could not be fetched because of an error are left out.
+        """
+        return self._get_many('track', 'tracks', track_ids)
+    
+    def get_artists(self, artist_ids):
+        """
+        Get many artists by ID using the multi-ID /artists endpoint.
+        
+        Returns a dict of artist ID to artist (None for unknown IDs). IDs that
+        could not be fetched because of an error are left out.
+        """
+        return self._get_many('artist', 'artists', artist_ids)
+    
+    def _get_many(self, endpoint, resource, ids):
+        """
+        Resolve IDs from the entity cache, fetching the rest in chunks of
+        BATCH_SIZE and caching each entity individually.
+        """
+        results = {}
+        missing = []
+        for entity_id in dict.fromkeys(ids):
+            found, value = entity_cache.get(endpoint, (entity_id,))
+            if found:
+                results[entity_id] = value
+            else:
+                missing.append(entity_id)
+        
+        url = f"{self.BASE_URL}/{resource}"
+        for start in range(0, len(missing), BATCH_SIZE):
+            chunk = missing[start:start + BATCH_SIZE]
+            try:
+                data = self._get_json(url, params={'ids': ','.join(chunk)})
+            except requests.RequestException as e:
+                logger.error(f"Error getting {resource} batch: {str(e)}")
+                continue
+            
+            # Spotify answers in request order, with null for unknown IDs
+            for entity_id, entity in zip(chunk, (data or {}).get(resource) or []):
+                entity_cache.set(endpoint, (entity_id,), entity)
+                results[entity_id] = entity
+        
+        return results
+
+
+class SpotifyEntityCollector:
+    """
+    Collect artist and track IDs from many callers, then resolve them all
+    with the minimum number of batch calls.
+    
+    The refresh sweep collects the seed artists of each batch of users
+    (tasks.prefetch_seed_artists); get_recommendations collects one call's
+    seeds.
+    
+    Usage:
+        collector = SpotifyEntityCollector()
+        collector.add_artists(ids_for_user_a)
+        collector.add_artists(ids_for_user_b)
+        collector.resolve()
+        collector.artist(some_id)
+    """
+    
+    def __init__(self, service=None):
+        self.service = service or SpotifyService()
+        self._pending_artists = {}
+        self._pending_tracks = {}
+        self.artists = {}
+        self.tracks = {}
+    
+    def add_artists(self, artist_ids):
+        for artist_id in artist_ids:
+            if artist_id not in self.artists:
+                self._pending_artists[artist_id] = None
+    
+    def add_tracks(self, track_ids):
+        for track_id in track_ids:
+            if track_id not in self.tracks:
+                self._pending_tracks[track_id] = None
+    
+    def resolve(self):
+        """Fetch everything pending. Safe to call repeatedly."""
+        if self._pending_artists:
+            self.artists.update(self.service.get_artists(list(self._pending_artists)))
+            self._pending_artists = {}
+        if self._pending_tracks:
+            self.tracks.update(self.service.get_tracks(list(self._pending_tracks)))
+            self._pending_tracks = {}
+    
+    def artist(self, artist_id):
+        return self.artists.get(artist_id)
+    
+    def track(self, track_id):
+        return self.tracks.get(track_id)
@@ -1,19 +1,119 @@
 """
 Celery tasks for asynchronous recommendation fetching.
 """
-from celery import shared_task
+import math
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from celery import group, shared_task
 from django.core.cache import cache
 from django.conf import settings
-from .models import Recommendation, RecommendationLog
-from .spotify_service import SpotifyService
-from users.models import User
+from django.db import transaction
+from django.db.models import F, Q, Subquery
+from django.utils import timezone
+from .models import Recommendation, RecommendationLog, RecommendationState, Track
+from . import recommendation_cache
+from .circuit_breaker import SpotifyUnavailable, spotify_breaker
+from .spotify_service import SpotifyEntityCollector, SpotifyService
+from .spotify_quota import BACKGROUND
+from users.models import User, UserProfile
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def build_recommendation(user_id, track):
+    """Unsaved Recommendation for a (projected) Spotify track payload."""
+    album = track.get('album') or {}
+    images = album.get('images') or []
+    return Recommendation(
+        user_id=user_id,
+        track_id=track['id'],
+        track_name=track['name'],
+        artist_name=', '.join([artist['name'] for artist in track.get('artists', [])]),
+        album_name=album.get('name', ''),
+        preview_url=track.get('preview_url'),
+        spotify_url=track['external_urls'].get('spotify', ''),
+        album_art_url=images[0]['url'] if images else None,
+        duration_ms=track.get('duration_ms', 0),
+        popularity=track.get('popularity', 0),
+    )
+
+
+def profile_seed_artists(favorite_artists):
+    """Seed artists a refresh takes from a profile's favorite artists."""
+    return (favorite_artists or [])[:2]
+
+
+def prefetch_seed_artists(user_ids):
+    """
+    Resolve the profile seed artists of a batch of users in one go.
+    
+    Names are mapped through ArtistNameIndex once per distinct name and the
+    artists fetched with one /artists call per BATCH_SIZE IDs, so each
+    user's refresh then finds its seed artists in the entity cache.
+    """
+    if spotify_breaker.state != 'closed':
+        return
+    
+    names = {}
+    favorites = UserProfile.objects.filter(user_id__in=user_ids).values_list('favorite_artists', flat=True)
+    for favorite_artists in favorites:
+        names.update(dict.fromkeys(profile_seed_artists(favorite_artists)))
+    if not names:
+        return
+    
+    try:
+        spotify_service = SpotifyService(priority=BACKGROUND)
+        collector = SpotifyEntityCollector(spotify_service)
+        collector.add_artists(spotify_service.resolve_artist_ids(list(names)).values())
+        collector.resolve()
+    except Exception as e:
+        logger.warning(f"Could not prefetch seed artists for {len(user_ids)} users: {str(e)}")
+
+
+def prune_recommendations(user_id, keep=100):
+    """Delete all but the user's newest `keep` recommendations in one query."""
+    newest = (
+        Recommendation.objects.filter(user_id=user_id)
+        .order_by('-created_at')
+        .values('id')[:keep]
+    )
+    return Recommendation.objects.filter(user_id=user_id).exclude(id__in=Subquery(newest)).delete()
+
+
+def serve_stale_recommendations(user_id, limit=20):
+    """
+    Keep the last good recommendations live while Spotify is unavailable.
+    
+    Extends the cached entry if there is one, otherwise re-caches the most
+    recent stored recommendations, instead of retrying against Spotify.
+    """
+    if recommendation_cache.touch_recommendations(user_id):
+        return {'status': 'stale', 'source': 'cache'}
+    
+    stored = list(recommendation_cache.stored_recommendations(user_id, limit))
+    if stored:
+        recommendation_cache.set_recommendations(user_id, stored)
+    return {'status': 'stale', 'source': 'database', 'count': len(stored)}
+
+
+@shared_task
+def warm_user_recommendations(user_id, expires_at=None):
+    """
+    Rebuild a user's cached recommendations before the entry expires.
+    
+    Queued by recommendation_cache on reads close to expiry (refresh-ahead).
+    """
+    recommendations = list(recommendation_cache.stored_recommendations(user_id))
+    if recommendations:
+        recommendation_cache.set_recommendations(user_id, recommendations, replaces_expiry=expires_at)
+    return {'status': 'success', 'count': len(recommendations)}
+
+
 @shared_task(bind=True, max_retries=3)
-def fetch_user_recommendations(self, user_id, limit=20, seed_genres=None, seed_artists=None):
+def fetch_user_recommendations(self, user_id, limit=20, seed_genres=None, seed_artists=None,
+                               priority=BACKGROUND):
     """
     Fetch recommendations for a specific user from Spotify API.
     
@@ -22,80 +122,84 @@ def fetch_user_recommendations(self, user_id, limit=20, seed_genres=None, seed_a
         limit: Number of recommendations to fetch
         seed_genres: List of genre seeds
         seed_artists: List of artist IDs
+        priority: Spotify quota lane ('interactive' or 'background')
     """
+    started_at = timezone.now()
+    
+    # Fail fast during a Spotify outage instead of queueing doomed retries
+    if spotify_breaker.is_open():
+        logger.warning(f"Spotify unavailable; serving stale recommendations for user {user_id}")
+        return serve_stale_recommendations(user_id, limit)
+    
     try:
         user = User.objects.get(id=user_id)
-        spotify_service = SpotifyService()
+        spotify_service = SpotifyService(priority=priority)
         
         # Use user profile preferences if no seeds provided
         if not seed_genres and not seed_artists:
             try:
                 profile = user.profile
                 seed_genres = profile.favorite_genres[:5] if profile.favorite_genres else []
+                seed_artists = profile_seed_artists(profile.favorite_artists)
             except Exception as e:
                 logger.warning(f"Could not get user profile: {str(e)}")
                 seed_genres = ['pop', 'rock']  # Default genres
         
-        # Fetch recommendations from Spotify
-        recommendations_data = spotify_service.get_recommendations(
+        # Fetch recommendations from Spotify (shared by users with the same seeds)
+        recommendations_data = spotify_service.get_shared_recommendations(
             seed_genres=seed_genres,
             seed_artists=seed_artists,
             limit=limit
         )
         
-        if not recommendations_data or 'tracks' not in recommendations_data:
+        if not recommendations_data or not recommendations_data.get('tracks'):
+            # Half-open rejects every call but another worker's probe, and the
+            # lookups swallow that into empty results
+            if spotify_breaker.state != 'closed':
+                raise SpotifyUnavailable(f"Spotify circuit breaker is {spotify_breaker.state}")
+            # Retried rather than recorded, so the user stays due for a refresh
             raise Exception("Failed to fetch recommendations from Spotify")
         
         tracks = recommendations_data['tracks']
         
-        # Clear old recommendations for this user (keep last 100)
-        old_recommendations = Recommendation.objects.filter(user=user).order_by('-created_at')
-        if old_recommendations.count() > 100:
-            ids_to_keep = list(old_recommendations.values_list('id', flat=True)[:100])
-            Recommendation.objects.filter(user=user).exclude(id__in=ids_to_keep).delete()
-        
-        # Save new recommendations
-        created_count = 0
-        for track in tracks:
-            artists = ', '.join([artist['name'] for artist in track.get('artists', [])])
-            album = track.get('album', {})
-            images = album.get('images', [])
+        # Top-ranked track is inserted last so it is the newest row
+        new_recommendations = [
+            build_recommendation(user_id, track) for track in reversed(tracks)
+        ]
+        # Shared artist/album/track rows are upserted in their own short
+        # transaction so their row locks aren't held through the user's writes
+        Track.upsert_from_spotify(tracks)
+        with transaction.atomic():
+            Recommendation.objects.bulk_create(new_recommendations)
+            created_count = len(new_recommendations)
             
-            Recommendation.objects.create(
+            # Clear old recommendations for this user (keep last 100)
+            prune_recommendations(user_id, keep=100)
+            RecommendationState.mark_refreshed(user_id, started_at)
+            
+            # Log the fetch operation
+            RecommendationLog.objects.create(
                 user=user,
-                track_id=track['id'],
-                track_name=track['name'],
-                artist_name=artists,
-                album_name=album.get('name', ''),
-                preview_url=track.get('preview_url'),
-                spotify_url=track['external_urls'].get('spotify', ''),
-                album_art_url=images[0]['url'] if images else None,
-                duration_ms=track.get('duration_ms', 0),
-                popularity=track.get('popularity', 0),
+                recommendations_count=created_count,
+                source='spotify',
+                status='success',
                 metadata={
-                    'artists': track.get('artists', []),
-                    'album': album,
+                    'seed_genres': seed_genres,
+                    'seed_artists': seed_artists,
+                    'limit': limit
                 }
             )
-            created_count += 1
         
-        # Log the fetch operation
-        RecommendationLog.objects.create(
-            user=user,
-            recommendations_count=created_count,
-            source='spotify',
-            status='success',
-            metadata={
-                'seed_genres': seed_genres,
-                'seed_artists': seed_artists,
-                'limit': limit
-            }
-        )
-        
-        # Cache the recommendations
-        cache_key = f'user_recommendations_{user_id}'
-        user_recommendations = Recommendation.objects.filter(user=user).order_by('-created_at')[:limit]
-        cache.set(cache_key, list(user_recommendations.values()), settings.RECOMMENDATION_CACHE_TTL)
+        # Cache the recommendations straight from the objects just written
+        cached = new_recommendations[::-1][:limit]
+        if len(cached) < limit:
+            older = (
+                Recommendation.objects.filter(user_id=user_id)
+                .exclude(id__in=[r.id for r in cached])
+                .order_by('-created_at')[:limit - len(cached)]
+            )
+            cached.extend(older)
+        recommendation_cache.set_recommendations(user_id, cached)
         
         logger.info(f"Successfully fetched {created_count} recommendations for user {user_id}")
         return {'status': 'success', 'count': created_count}
@@ -103,6 +207,9 @@ def fetch_user_recommendations(self, user_id, limit=20, seed_genres=None, seed_a
     except User.DoesNotExist:
         logger.error(f"User {user_id} not found")
         return {'status': 'error', 'message': 'User not found'}
+    except SpotifyUnavailable:
+        logger.warning(f"Spotify unavailable; serving stale recommendations for user {user_id}")
+        return serve_stale_recommendations(user_id, limit)
     except Exception as e:
         logger.error(f"Error fetching recommendations for user {user_id}: {str(e)}")
         
@@ -123,20 +230,273 @@ def fetch_user_recommendations(self, user_id, limit=20, seed_genres=None, seed_a
         raise self.retry(exc=e, countdown=60)
 
 
+SWEEP_STATE_KEY = 'recommendation_sweep'
+
+
+def _sweep_counter_key(sweep_id, name):
+    return f'recommendation_sweep:{sweep_id}:{name}'
+
+
+def _incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, settings.RECOMMENDATION_SWEEP_STATE_TTL)
+        return cache.incr(key, delta)
+
+
+def get_sweep_progress():
+    """
+    Return the state of the current or last refresh sweep, or None.
+    
+    Includes how many users were queued so far, how many of those tasks
+    have finished and how many are still in flight.
+    """
+    state = cache.get(SWEEP_STATE_KEY)
+    if not state:
+        return None
+    sweep_id = state['sweep_id']
+    counters = cache.get_many([
+        _sweep_counter_key(sweep_id, 'in_flight'),
+        _sweep_counter_key(sweep_id, 'done'),
+    ])
+    return {
+        **state,
+        'in_flight': max(0, counters.get(_sweep_counter_key(sweep_id, 'in_flight'), 0)),
+        'done': counters.get(_sweep_counter_key(sweep_id, 'done'), 0),
+    }
+
+
+def sweep_users(state):
+    """
+    Users a sweep refreshes.
+    
+    A 'scheduled' sweep covers the users its scheduler tick marked queued;
+    an 'all' sweep covers everyone.
+    """
+    users = User.objects.all()
+    if state.get('mode', 'all') == 'scheduled':
+        queued_since = datetime.fromtimestamp(state['queued_since'], tz=dt_timezone.utc)
+        users = users.filter(recommendation_state__queued_at__gte=queued_since)
+    return users
+
+
+def _save_sweep(state):
+    state['heartbeat'] = time.time()
+    cache.set(SWEEP_STATE_KEY, state, settings.RECOMMENDATION_SWEEP_STATE_TTL)
+
+
+def _check_running_sweep():
+    """
+    Response for a sweep that is still running, or None if a new one may start.
+    
+    A sweep that stopped making progress (e.g. its worker was killed) is
+    resumed from its last queued user; one that is still live is left alone.
+    """
+    state = cache.get(SWEEP_STATE_KEY)
+    if not state or state['status'] != 'running':
+        return None
+    if time.time() - state['heartbeat'] < settings.RECOMMENDATION_SWEEP_STALL_TIMEOUT:
+        logger.info(f"Recommendation sweep {state['sweep_id']} still running; not starting another")
+        return {'status': 'running', 'sweep_id': state['sweep_id']}
+    
+    logger.warning(
+        f"Resuming stalled recommendation sweep {state['sweep_id']} after user {state['cursor']}"
+    )
+    # Tasks lost with the stalled sweep would never release their slots
+    cache.set(_sweep_counter_key(state['sweep_id'], 'in_flight'), 0, settings.RECOMMENDATION_SWEEP_STATE_TTL)
+    _save_sweep(state)
+    continue_recommendation_sweep.delay(state['sweep_id'])
+    return {'status': 'resumed', 'sweep_id': state['sweep_id'], 'users_queued': state['queued']}
+
+
+def start_sweep(mode, **params):
+    """Start a sweep over sweep_users() and return its state."""
+    state = {
+        'sweep_id': uuid.uuid4().hex,
+        'mode': mode,
+        **params,
+        'status': 'running',
+        'cursor': 0,
+        'queued': 0,
+        'started_at': time.time(),
+        'finished_at': None,
+    }
+    state['total'] = sweep_users(state).count()
+    _save_sweep(state)
+    logger.info(f"Starting {mode} recommendation sweep {state['sweep_id']} for {state['total']} users")
+    continue_recommendation_sweep.delay(state['sweep_id'])
+    return state
+
+
 @shared_task
 def refresh_all_user_recommendations():
     """
-    Periodic task to refresh recommendations for all users.
+    Refresh recommendations for every user, for manual runs.
+    
+    Starts an 'all' sweep that queues users in batches through
+    continue_recommendation_sweep, unless a sweep is already running (a
+    stalled one is resumed instead).
+    """
+    running = _check_running_sweep()
+    if running:
+        return running
+    
+    state = start_sweep('all')
+    return {'status': 'started', 'sweep_id': state['sweep_id'], 'users_total': state['total']}
+
+
+@shared_task
+def continue_recommendation_sweep(sweep_id):
+    """
+    Queue the next batches of a sweep, up to the in-flight limit.
+    
+    User IDs are read in ID order, RECOMMENDATION_SWEEP_BATCH_SIZE at a
+    time; each batch's seed artists are prefetched together and the batch
+    is sent as one group. The task re-schedules itself
+    while the limit is reached and marks the sweep complete once every
+    queued refresh has finished.
+    """
+    state = cache.get(SWEEP_STATE_KEY)
+    if not state or state['sweep_id'] != sweep_id or state['status'] != 'running':
+        return {'status': 'stopped', 'sweep_id': sweep_id}
+    
+    in_flight_key = _sweep_counter_key(sweep_id, 'in_flight')
+    while True:
+        room = settings.RECOMMENDATION_SWEEP_MAX_IN_FLIGHT - max(0, cache.get(in_flight_key, 0))
+        if room <= 0:
+            break
+        user_ids = list(
+            sweep_users(state).filter(id__gt=state['cursor'])
+            .order_by('id')
+            .values_list('id', flat=True)[:min(room, settings.RECOMMENDATION_SWEEP_BATCH_SIZE)]
+        )
+        if not user_ids:
+            break
+        
+        prefetch_seed_artists(user_ids)
+        done = on_sweep_task_done.si(sweep_id)
+        _incr(in_flight_key, len(user_ids))
+        group(
+            fetch_user_recommendations.s(user_id).set(link=done, link_error=done)
+            for user_id in user_ids
+        ).apply_async()
+        
+        # Saved per batch so an interrupted sweep resumes after the last queued user
+        state['cursor'] = user_ids[-1]
+        state['queued'] += len(user_ids)
+        _save_sweep(state)
+        logger.info(f"Recommendation sweep {sweep_id}: queued {state['queued']}/{state['total']} users")
+    
+    in_flight = max(0, cache.get(in_flight_key, 0))
+    done = cache.get(_sweep_counter_key(sweep_id, 'done'), 0)
+    if done != state.get('done_seen'):
+        state['done_seen'] = done
+        state['progress_at'] = time.time()
+    
+    exhausted = not sweep_users(state).filter(id__gt=state['cursor']).exists()
+    # Refreshes whose messages were lost never report back; stop waiting for them
+    stalled = time.time() - state.get('progress_at', state['started_at']) > settings.RECOMMENDATION_SWEEP_STALL_TIMEOUT
+    if exhausted and (in_flight == 0 or stalled):
+        if in_flight:
+            logger.warning(f"Recommendation sweep {sweep_id}: {in_flight} refreshes never reported back")
+        state['status'] = 'complete'
+        state['finished_at'] = time.time()
+        _save_sweep(state)
+        logger.info(
+            f"Recommendation sweep {sweep_id} complete: {state['queued']} users in "
+            f"{state['finished_at'] - state['started_at']:.0f}s"
+        )
+        return {'status': 'complete', 'sweep_id': sweep_id, 'users_queued': state['queued']}
+    
+    _save_sweep(state)
+    continue_recommendation_sweep.apply_async((sweep_id,), countdown=settings.RECOMMENDATION_SWEEP_POLL_INTERVAL)
+    return {'status': 'running', 'sweep_id': sweep_id, 'users_queued': state['queued'], 'in_flight': in_flight}
+
+
+@shared_task
+def on_sweep_task_done(sweep_id):
+    """Release a sweep slot when a user's refresh finishes or finally fails."""
+    try:
+        cache.decr(_sweep_counter_key(sweep_id, 'in_flight'))
+    except ValueError:
+        # Counter expired or was reset by a resume
+        pass
+    _incr(_sweep_counter_key(sweep_id, 'done'))
+
+
+def tier_users(tier, now, newer_tier=None):
+    """
+    Users in a refresh tier: last active within tier['active_within'] but
+    not within the preceding (newer) tier's window.
     """
     users = User.objects.all()
-    total_refreshed = 0
+    if tier['active_within'] is not None:
+        users = users.filter(
+            recommendation_state__last_active_at__gte=now - timedelta(seconds=tier['active_within'])
+        )
+    if newer_tier is not None:
+        users = users.exclude(
+            recommendation_state__last_active_at__gte=now - timedelta(seconds=newer_tier['active_within'])
+        )
+    return users
+
+
+@shared_task
+def schedule_recommendation_refreshes():
+    """
+    Queue the refreshes due in this scheduler tick, per activity tier.
     
-    for user in users:
-        try:
-            fetch_user_recommendations.delay(user.id)
-            total_refreshed += 1
-        except Exception as e:
-            logger.error(f"Error queuing refresh for user {user.id}: {str(e)}")
+    Runs every RECOMMENDATION_SCHEDULER_TICK seconds. A tier's users are due
+    when dirty or last refreshed more than the tier's interval ago; each
+    tick picks at most the tier's share of one interval (size * tick /
+    interval), most urgent first, so a tier's work is spread across its
+    interval rather than bursting. The picked users are refreshed by a
+    'scheduled' sweep, in batches under RECOMMENDATION_SWEEP_MAX_IN_FLIGHT;
+    ticks that find the previous sweep unfinished queue nothing new.
+    """
+    running = _check_running_sweep()
+    if running:
+        return running
+    
+    now = timezone.now()
+    tick = settings.RECOMMENDATION_SCHEDULER_TICK
+    requeue_before = now - timedelta(seconds=settings.RECOMMENDATION_QUEUED_TIMEOUT)
+    
+    scheduled = {}
+    user_ids = []
+    newer_tier = None
+    for tier in settings.RECOMMENDATION_REFRESH_TIERS:
+        users = tier_users(tier, now, newer_tier)
+        newer_tier = tier
+        budget = math.ceil(users.count() * tick / tier['interval'])
+        if not budget:
+            scheduled[tier['name']] = 0
+            continue
+        
+        refresh_before = now - timedelta(seconds=tier['interval'])
+        due = users.filter(
+            Q(recommendation_state__isnull=True)
+            | Q(recommendation_state__dirty_since__isnull=False)
+            | Q(recommendation_state__refreshed_at__isnull=True)
+            | Q(recommendation_state__refreshed_at__lt=refresh_before)
+        ).filter(
+            Q(recommendation_state__queued_at__isnull=True)
+            | Q(recommendation_state__queued_at__lt=requeue_before)
+            | Q(recommendation_state__queued_at__lt=F('recommendation_state__refreshed_at'))
+        ).order_by(
+            F('recommendation_state__dirty_since').asc(nulls_last=True),
+            F('recommendation_state__refreshed_at').asc(nulls_first=True),
+            'id',
+        )
+        tier_ids = list(due.values_list('id', flat=True)[:budget])
+        scheduled[tier['name']] = len(tier_ids)
+        user_ids.extend(tier_ids)
+    
+    logger.info(f"Scheduling {len(user_ids)} recommendation refreshes: {scheduled}")
+    if not user_ids:
+        return {'status': 'success', 'scheduled': scheduled}
     
-    logger.info(f"Queued recommendation refresh for {total_refreshed} users")
-    return {'status': 'success', 'users_queued': total_refreshed}
+    RecommendationState.mark_queued(user_ids, now)
+    state = start_sweep('scheduled', queued_since=now.timestamp())
+    return {'status': 'success', 'scheduled': scheduled, 'sweep_id': state['sweep_id']}
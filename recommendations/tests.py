@@ -1,3 +1,1146 @@
+"""
+Tests for recommendations app.
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import httpx
+import requests
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from music_discovery_backend import caching
+from music_discovery_backend.celery import app as celery_app
+from music_discovery_backend.renderers import ORJSONRenderer
+from users.models import User, UserProfile
+from . import recommendation_cache, spotify_service
+from .async_spotify_service import AsyncSpotifyService, run_sync
+from .circuit_breaker import CircuitBreaker, SpotifyUnavailable, spotify_breaker
+from .fake_spotify import FakeSpotify, FakeSpotifyServer
+from .models import Album, ArtistNameIndex, Recommendation, RecommendationState, Track
+from .serializers import RecommendationSerializer
+from .spotify_cache import entity_cache
+from .singleflight import SingleFlight
+from .spotify_quota import SpotifyQuota, SpotifyQuotaExceeded
+from .spotify_service import SpotifyService, SpotifyTokenManager, get_session
+from .tasks import (
+    SWEEP_STATE_KEY,
+    fetch_user_recommendations,
+    get_sweep_progress,
+    refresh_all_user_recommendations,
+    schedule_recommendation_refreshes,
+)
 
-# Create your tests here.
+
+def run_tasks_eagerly(test):
+    """Run queued Celery tasks inline until the test ends, as a worker would."""
+    previous = celery_app.conf.task_always_eager
+    celery_app.conf.task_always_eager = True
+    test.addCleanup(setattr, celery_app.conf, 'task_always_eager', previous)
+
+
+class SpotifySessionTest(TestCase):
+    """Test the pooled Spotify HTTP session."""
+
+    def test_session_is_shared_per_process(self):
+        """Test every service instance reuses the same session."""
+        self.assertIs(SpotifyService().session, SpotifyService().session)
+        self.assertIs(SpotifyService().session, get_session())
+
+    def test_fanout_pool_is_shared_per_process(self):
+        """Test lookups reuse one thread pool, rebuilt after a fork."""
+        pool = spotify_service.get_executor()
+        self.assertIs(spotify_service.get_executor(), pool)
+        with mock.patch('recommendations.spotify_service.os.getpid', return_value=-1):
+            child = spotify_service.get_executor()
+            self.assertIsNot(child, pool)
+            self.assertIs(spotify_service.get_executor(), child)
+
+    def test_adapter_only_retries_connections(self):
+        """Test status retries are left to _request and Retry-After is capped."""
+        retry = get_session().get_adapter(SpotifyService.BASE_URL).max_retries
+        self.assertFalse(retry.status_forcelist)
+        self.assertFalse(retry.read)
+
+        class FakeResponse:
+            headers = {'Retry-After': '3600'}
+
+        with self.settings(SPOTIFY_MAX_RETRY_AFTER=5):
+            self.assertEqual(spotify_service.retry_delay(FakeResponse(), 0), 5)
+
+    def test_rate_limited_retries_draw_quota(self):
+        """Test each retry of a 429 acquires quota and reaches the breaker."""
+        limited, ok = mock.Mock(status_code=429, headers={'Retry-After': '0'}), mock.Mock(status_code=200)
+        service = SpotifyService()
+        with mock.patch.object(service, '_get_access_token', return_value='token'), \
+                mock.patch.object(service.session, 'request', side_effect=[limited, limited, ok]), \
+                mock.patch('recommendations.spotify_service.spotify_quota') as quota, \
+                mock.patch('recommendations.spotify_service.spotify_breaker') as breaker:
+            breaker.before_call.return_value = False
+            self.assertIs(service._request('GET', 'https://api.spotify.com/v1/tracks'), ok)
+        self.assertEqual(quota.acquire.call_count, 3)
+        self.assertEqual(breaker.record_failure.call_count, 2)
+
+
+class SpotifyRecommendationsFanOutTest(TestCase):
+    """Test concurrent fan-out in get_recommendations."""
+
+    def test_results_merge_in_sequential_order(self):
+        """Test slower lookups don't change the merged order."""
+        def search(query, limit=10):
+            # The first genre answers last
+            time.sleep(0.2 if query == 'genre:rock' else 0)
+            return [{'id': f'{query}-{i}'} for i in range(limit)]
+
+        service = SpotifyService()
+        with mock.patch.object(service, '_search_tracks_for_recommendations', side_effect=search):
+            result = service.get_recommendations(seed_genres=['rock', 'pop'], limit=4)
+
+        self.assertEqual(
+            [track['id'] for track in result['tracks']],
+            ['genre:rock-0', 'genre:rock-1', 'genre:pop-0', 'genre:pop-1']
+        )
+
+    def test_lookups_past_deadline_are_dropped(self):
+        """Test a lookup that misses the deadline contributes nothing."""
+        def search(query, limit=10):
+            if query == 'genre:rock':
+                time.sleep(0.5)
+            return [{'id': query}]
+
+        service = SpotifyService()
+        with self.settings(SPOTIFY_RECOMMENDATIONS_DEADLINE=0.1), \
+                mock.patch.object(service, '_search_tracks_for_recommendations', side_effect=search):
+            result = service.get_recommendations(seed_genres=['rock', 'pop'], limit=4)
+
+        self.assertEqual([track['id'] for track in result['tracks']], ['genre:pop'])
+
+    def test_deadline_runs_from_when_a_lookup_starts(self):
+        """Test time queued behind other lookups doesn't count against a lookup."""
+        def search(query, limit=10):
+            time.sleep(0.15)
+            return [{'id': query}]
+
+        service = SpotifyService()
+        pool = spotify_service.ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        with self.settings(SPOTIFY_RECOMMENDATIONS_DEADLINE=0.25), \
+                mock.patch('recommendations.spotify_service.get_executor', return_value=pool), \
+                mock.patch.object(service, '_search_tracks_for_recommendations', side_effect=search):
+            result = service.get_recommendations(seed_genres=['rock', 'pop', 'jazz'], limit=6)
+
+        # rock and pop each start within the deadline; jazz never gets the worker in time
+        self.assertEqual([track['id'] for track in result['tracks']], ['genre:rock', 'genre:pop'])
+
+
+class SpotifyEntityCacheTest(TestCase):
+    """Test the two-tier cache around Spotify entity lookups."""
+
+    def setUp(self):
+        cache.clear()
+        entity_cache.local.clear()
+        entity_cache.reset_stats()
+        self.service = SpotifyService()
+
+    def _response(self, status_code, payload=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = b'{}' if payload is None else payload
+        return response
+
+    def test_repeat_lookup_is_served_from_cache(self):
+        """Test a second get_artist call doesn't reach Spotify."""
+        response = self._response(200, b'{"id": "a1", "genres": ["rock"]}')
+        with mock.patch.object(self.service, '_request', return_value=response) as request:
+            self.assertEqual(self.service.get_artist('a1')['id'], 'a1')
+            self.assertEqual(self.service.get_artist('a1')['id'], 'a1')
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(entity_cache.stats()['artist']['local_hits'], 1)
+
+    def test_not_found_is_negatively_cached(self):
+        """Test a 404 is remembered instead of re-requested."""
+        error = requests.HTTPError(response=self._response(404))
+        with mock.patch.object(self.service, '_request', side_effect=error) as request:
+            self.assertIsNone(self.service.get_track('missing'))
+            self.assertIsNone(self.service.get_track('missing'))
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(entity_cache.stats()['track']['negative_hits'], 1)
+
+    def test_transient_errors_are_not_cached(self):
+        """Test a 5xx failure is retried on the next lookup."""
+        error = requests.HTTPError(response=self._response(503))
+        with mock.patch.object(self.service, '_request', side_effect=error) as request:
+            self.assertIsNone(self.service.get_artist('a2'))
+            self.assertIsNone(self.service.get_artist('a2'))
+        self.assertEqual(request.call_count, 2)
+
+
+class SharedRecommendationsTest(TestCase):
+    """Test seed-signature sharing of recommendation results."""
+
+    def setUp(self):
+        cache.clear()
+        entity_cache.local.clear()
+
+    def test_equivalent_seeds_share_one_computation(self):
+        """Test seed order, case and unused extra seeds don't split the cache."""
+        service = SpotifyService()
+        result = {'tracks': [{'id': 't1'}]}
+        with mock.patch.object(service, 'get_recommendations', return_value=result) as compute:
+            first = service.get_shared_recommendations(seed_genres=['Rock', 'pop', 'jazz', 'blues'])
+            second = service.get_shared_recommendations(seed_genres=['jazz', 'pop', 'rock', 'metal'])
+            other = service.get_shared_recommendations(seed_genres=['rock'], limit=10)
+        self.assertEqual(first, second)
+        self.assertEqual(other, result)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_failed_results_are_not_cached(self):
+        """Test an empty or failed computation is retried by the next user."""
+        service = SpotifyService()
+        with self.settings(SPOTIFY_SINGLEFLIGHT_RESULT_TTL=0), \
+                mock.patch.object(service, 'get_recommendations', side_effect=[None, {'tracks': []}, {'tracks': [{'id': 't1'}]}]) as compute:
+            service.get_shared_recommendations(seed_genres=['rock'])
+            service.get_shared_recommendations(seed_genres=['rock'])
+            result = service.get_shared_recommendations(seed_genres=['rock'])
+        self.assertEqual(compute.call_count, 3)
+        self.assertEqual(result, {'tracks': [{'id': 't1'}]})
+
+
+class SpotifyBatchLookupTest(TestCase):
+    """Test batched entity resolution."""
+
+    def setUp(self):
+        cache.clear()
+        entity_cache.local.clear()
+        self.service = SpotifyService()
+
+    def test_get_tracks_chunks_and_skips_cached_ids(self):
+        """Test IDs are fetched 50 at a time and cached IDs are skipped."""
+        entity_cache.set('track', ('t0',), {'id': 't0'})
+
+        def get_json(url, params=None):
+            ids = params['ids'].split(',')
+            return {'tracks': [{'id': track_id} for track_id in ids]}
+
+        ids = [f't{i}' for i in range(101)]
+        with mock.patch.object(self.service, '_get_json', side_effect=get_json) as get:
+            tracks = self.service.get_tracks(ids)
+
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(len(tracks), 101)
+        self.assertEqual(len(get.call_args_list[0].kwargs['params']['ids'].split(',')), 50)
+
+        # Now every track is cached individually
+        with mock.patch.object(self.service, '_get_json') as get:
+            self.assertEqual(self.service.get_track('t42'), {'id': 't42'})
+        get.assert_not_called()
+
+
+class SingleFlightTest(TestCase):
+    """Test coalescing of identical in-flight Spotify calls."""
+
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight(prefix='test:inflight')
+
+    def test_concurrent_threads_share_one_call(self):
+        """Test identical calls from several threads run once."""
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'ok': True}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.flight.do('k', fetch)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'ok': True}] * 5)
+
+    def test_follower_waits_for_other_workers_result(self):
+        """Test a worker that loses the lock reuses the leader's result."""
+        cache.add('test:inflight:lock:k', 1, 30)
+
+        def publish():
+            time.sleep(0.1)
+            cache.set('test:inflight:result:k', ({'from': 'leader'},), 5)
+            cache.delete('test:inflight:lock:k')
+
+        threading.Thread(target=publish).start()
+        fetch = mock.Mock(return_value={'from': 'follower'})
+        self.assertEqual(self.flight.do('k', fetch), {'from': 'leader'})
+        fetch.assert_not_called()
+
+    def test_follower_falls_back_when_leader_fails(self):
+        """Test a worker makes the call itself if the leader gives up."""
+        cache.add('test:inflight:lock:k', 1, 30)
+        threading.Timer(0.1, cache.delete, args=['test:inflight:lock:k']).start()
+        fetch = mock.Mock(return_value={'from': 'follower'})
+        self.assertEqual(self.flight.do('k', fetch), {'from': 'follower'})
+        fetch.assert_called_once()
+
+
+class SpotifyTokenManagerTest(TestCase):
+    """Test the in-process, lock-guarded access token."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_token_is_served_from_memory(self):
+        """Test repeated calls neither refetch nor read Redis."""
+        manager = SpotifyTokenManager()
+        fetch = mock.Mock(return_value=('token-1', 3600))
+        self.assertEqual(manager.get_token(fetch), 'token-1')
+        with mock.patch.object(spotify_service.cache, 'get') as cache_get:
+            self.assertEqual(manager.get_token(fetch), 'token-1')
+        cache_get.assert_not_called()
+        fetch.assert_called_once()
+
+    def test_other_processes_adopt_the_renewed_token(self):
+        """Test only one process posts to the accounts service."""
+        fetch = mock.Mock(return_value=('token-1', 3600))
+        SpotifyTokenManager().get_token(fetch)
+        self.assertEqual(SpotifyTokenManager().get_token(fetch), 'token-1')
+        fetch.assert_called_once()
+
+    def test_invalidate_forces_renewal(self):
+        """Test a rejected token is dropped everywhere."""
+        manager = SpotifyTokenManager()
+        fetch = mock.Mock(side_effect=[('token-1', 3600), ('token-2', 3600)])
+        manager.get_token(fetch)
+        manager.invalidate('token-1')
+        self.assertEqual(manager.get_token(fetch), 'token-2')
+        self.assertEqual(cache.get(SpotifyTokenManager.CACHE_KEY)['token'], 'token-2')
+
+    def test_failed_background_renewals_back_off(self):
+        """Test renewal retries double and stop once the token has expired."""
+        manager = SpotifyTokenManager()
+        manager._token, manager._expires_at = 'token-1', time.time() + 60
+        manager._fetch = mock.Mock(side_effect=requests.ConnectionError('down'))
+        with self.settings(SPOTIFY_TOKEN_RETRY_BACKOFF=4, SPOTIFY_TOKEN_RETRY_MAX_BACKOFF=10), \
+                mock.patch.object(manager, '_start_timer') as start_timer, \
+                mock.patch('recommendations.spotify_service.random.uniform', return_value=1):
+            for _ in range(3):
+                manager._refresh_in_background()
+            self.assertEqual([c.args[0] for c in start_timer.call_args_list], [4, 8, 10])
+
+            manager._expires_at = time.time() - 1
+            manager._refresh_in_background()
+        self.assertEqual(start_timer.call_count, 3)
+        self.assertEqual(manager._fetch.call_count, 3)
+
+
+class ArtistNameIndexTest(TestCase):
+    """Test persistent artist name resolution."""
+
+    def setUp(self):
+        cache.clear()
+        entity_cache.local.clear()
+        self.service = SpotifyService()
+
+    def test_normalize_ignores_case_and_diacritics(self):
+        """Test spelling variants share one index entry."""
+        self.assertEqual(ArtistNameIndex.normalize('  Beyoncé '), 'beyonce')
+        self.assertEqual(ArtistNameIndex.normalize('THE  Beatles'), 'the beatles')
+
+    def test_long_names_fit_the_index(self):
+        """Test names NFKD lengthens past the column stay distinct and indexable."""
+        names = ['\ufdfa' * 20 + ' one', '\ufdfa' * 20 + ' two']
+        normalized = [ArtistNameIndex.normalize(name) for name in names]
+        self.assertTrue(all(len(key) <= ArtistNameIndex.NAME_MAX_LENGTH for key in normalized))
+        self.assertNotEqual(normalized[0], normalized[1])
+        ArtistNameIndex.remember([(names[0], 'a' * 22), (names[1], 'b' * 22)])
+        self.assertEqual(ArtistNameIndex.lookup(normalized), {normalized[0]: 'a' * 22, normalized[1]: 'b' * 22})
+
+    def test_names_are_searched_once_then_indexed(self):
+        """Test a resolved name is reused without searching Spotify."""
+        result = {'artists': {'items': [{'id': '3WrFJ7ztbogyGnTHbHJFl2'}]}}
+        with mock.patch.object(self.service, 'search_artists', return_value=result) as search:
+            resolved = self.service.resolve_artist_ids(['The Beatles'])
+        self.assertEqual(resolved, {'The Beatles': '3WrFJ7ztbogyGnTHbHJFl2'})
+        search.assert_called_once()
+
+        with mock.patch.object(self.service, 'search_artists') as search:
+            resolved = self.service.resolve_artist_ids(['the beatles', '0OdUWJ0sBjDrqHygGUXeCF'])
+        search.assert_not_called()
+        self.assertEqual(resolved, {
+            'the beatles': '3WrFJ7ztbogyGnTHbHJFl2',
+            '0OdUWJ0sBjDrqHygGUXeCF': '0OdUWJ0sBjDrqHygGUXeCF',
+        })
+
+
+class SpotifyQuotaTest(TestCase):
+    """Test the shared, priority-aware Spotify quota."""
+
+    def setUp(self):
+        cache.clear()
+        self.quota = SpotifyQuota()
+
+    def test_background_lane_leaves_reserve_for_interactive(self):
+        """Test the sweep can't take the tokens kept for user requests."""
+        with self.settings(SPOTIFY_QUOTA_RATE=0.01, SPOTIFY_QUOTA_BURST=3,
+                           SPOTIFY_QUOTA_INTERACTIVE_RESERVE=1,
+                           SPOTIFY_QUOTA_WAIT_TIMEOUTS={'interactive': 0, 'background': 0}):
+            self.quota.acquire('background')
+            self.quota.acquire('background')
+            with self.assertRaises(SpotifyQuotaExceeded):
+                self.quota.acquire('background')
+            self.quota.acquire('interactive')
+
+        metrics = self.quota.metrics()
+        self.assertEqual(metrics['background']['granted'], 2)
+        self.assertEqual(metrics['background']['rejected'], 1)
+        self.assertEqual(metrics['interactive']['granted'], 1)
+
+    def test_requests_wait_for_refill(self):
+        """Test a request within its timeout waits instead of failing."""
+        with self.settings(SPOTIFY_QUOTA_RATE=20, SPOTIFY_QUOTA_BURST=1,
+                           SPOTIFY_QUOTA_INTERACTIVE_RESERVE=0):
+            self.quota.acquire('background')
+            self.quota.acquire('background')
+        self.assertEqual(self.quota.metrics()['background']['waited'], 1)
+
+    def test_metrics_written_in_batches(self):
+        """Test grants are counted in-process rather than one cache write each."""
+        with self.settings(SPOTIFY_QUOTA_METRICS_FLUSH_INTERVAL=60), \
+                mock.patch('recommendations.spotify_quota.cache.incr') as incr:
+            for _ in range(5):
+                self.quota.acquire('interactive')
+        incr.assert_not_called()
+        self.assertEqual(self.quota.metrics()['interactive']['granted'], 5)
+
+
+class SpotifyProjectionTest(TestCase):
+    """Test Spotify payloads are trimmed right after decoding."""
+
+    def test_track_payloads_drop_unused_fields(self):
+        """Test markets and other unused fields are dropped from tracks."""
+        track = FakeSpotify().catalog.track('0' * 22)
+        projected = spotify_service.project_payload({'tracks': [track, None]})['tracks']
+        self.assertIsNone(projected[1])
+        self.assertNotIn('available_markets', projected[0])
+        self.assertNotIn('available_markets', projected[0]['album'])
+        self.assertNotIn('external_ids', projected[0])
+        self.assertEqual(projected[0]['artists'][0]['name'], track['artists'][0]['name'])
+        self.assertEqual(projected[0]['album']['images'], track['album']['images'])
+        self.assertEqual(projected[0]['external_urls'], track['external_urls'])
+
+    def test_search_pages_and_artists_are_projected(self):
+        """Test paged search results keep paging info and artist genres."""
+        page = FakeSpotify().catalog.search('rock', 'artist', 2)
+        projected = spotify_service.project_payload(page)['artists']
+        self.assertEqual(projected['total'], 1000)
+        self.assertEqual(projected['items'][0]['genres'], page['artists']['items'][0]['genres'])
+        self.assertNotIn('followers', projected['items'][0])
+
+
+class FakeSpotifyServerTest(TestCase):
+    """Test SpotifyService against the local stand-in server."""
+
+    def setUp(self):
+        cache.clear()
+        entity_cache.local.clear()
+        spotify_breaker.reset()
+        self.server = FakeSpotifyServer().start()
+        self.addCleanup(self.server.stop)
+
+    def test_recommendations_from_synthetic_data(self):
+        """Test the full recommendation path works offline."""
+        with self.settings(SPOTIFY_API_BASE_URL=self.server.api_url,
+                           SPOTIFY_AUTH_URL=self.server.auth_url):
+            result = SpotifyService().get_recommendations(seed_genres=['rock', 'pop'], limit=10)
+        self.assertEqual(len(result['tracks']), 10)
+        self.assertEqual(len(result['tracks'][0]['id']), 22)
+
+    def test_injected_rate_limits_are_retried(self):
+        """Test 429s carry Retry-After and calls still succeed on retry."""
+        fake = self.server.fake
+        fake.rate_limit_rate = 0.5
+        fake.retry_after = 0
+        # With this seed at least one batch call is rate limited before succeeding
+        fake.random.seed(3)
+        with self.settings(SPOTIFY_API_BASE_URL=self.server.api_url,
+                           SPOTIFY_AUTH_URL=self.server.auth_url):
+            artists = SpotifyService().get_artists([f'{i:022d}' for i in range(60)])
+        self.assertEqual(len(artists), 60)
+        self.assertGreater(fake.requests, 2)
+
+
+class AsyncSpotifyServiceTest(TestCase):
+    """Test the asyncio client against the local stand-in server."""
+
+    def setUp(self):
+        cache.clear()
+        entity_cache.local.clear()
+        spotify_breaker.reset()
+        self.server = FakeSpotifyServer(latency_ms=20).start()
+        self.addCleanup(self.server.stop)
+
+    def test_matches_sync_service(self):
+        """Test both services return the same recommendations."""
+        with self.settings(SPOTIFY_API_BASE_URL=self.server.api_url,
+                           SPOTIFY_AUTH_URL=self.server.auth_url):
+            expected = SpotifyService().get_recommendations(seed_genres=['jazz', 'blues'], limit=8)
+            cache.clear()
+            entity_cache.local.clear()
+            result = run_sync(
+                AsyncSpotifyService().get_recommendations(seed_genres=['jazz', 'blues'], limit=8)
+            )
+        self.assertEqual(
+            [track['id'] for track in result['tracks']],
+            [track['id'] for track in expected['tracks']]
+        )
+
+    def test_only_read_timeouts_are_retried(self):
+        """Test the async retry policy matches the sync service's."""
+        ok = mock.Mock(status_code=200)
+        service = AsyncSpotifyService()
+        with mock.patch.object(service, '_get_access_token', mock.AsyncMock(return_value='token')), \
+                mock.patch('recommendations.async_spotify_service.get_async_client') as get_client, \
+                mock.patch('recommendations.async_spotify_service.retry_delay', return_value=0):
+            client = get_client.return_value
+            client.request = mock.AsyncMock(side_effect=[httpx.ReadTimeout('slow'), ok])
+            self.assertIs(run_sync(service._request('GET', 'https://api.spotify.com/v1/tracks')), ok)
+
+            client.request = mock.AsyncMock(side_effect=httpx.ConnectError('refused'))
+            with self.assertRaises(httpx.ConnectError):
+                run_sync(service._request('GET', 'https://api.spotify.com/v1/tracks'))
+            self.assertEqual(client.request.await_count, 1)
+
+    def test_identical_lookups_share_one_request(self):
+        """Test concurrent identical calls on one loop are coalesced."""
+        async def lookups(service):
+            return await asyncio.gather(*(service.search_tracks('genre:rock') for _ in range(20)))
+
+        with self.settings(SPOTIFY_API_BASE_URL=self.server.api_url,
+                           SPOTIFY_AUTH_URL=self.server.auth_url):
+            service = AsyncSpotifyService()
+            run_sync(service._get_access_token())
+            before = self.server.fake.requests
+            results = run_sync(lookups(service))
+        self.assertEqual(len(results), 20)
+        self.assertEqual(self.server.fake.requests - before, 1)
+
+
+class CircuitBreakerTest(TestCase):
+    """Test the shared Spotify circuit breaker and stale fallback."""
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker(name='test')
+
+    def test_opens_when_failure_rate_crosses_threshold(self):
+        """Test the breaker opens only after enough calls fail."""
+        with self.settings(SPOTIFY_BREAKER_MIN_CALLS=4, SPOTIFY_BREAKER_FAILURE_RATE=0.5,
+                           SPOTIFY_BREAKER_STATE_TTL=0):
+            self.breaker.record_success()
+            self.breaker.record_failure()
+            self.breaker.record_failure()
+            self.assertEqual(self.breaker.state, 'closed')
+            self.breaker.record_failure()
+            self.assertEqual(self.breaker.state, 'open')
+            with self.assertRaises(SpotifyUnavailable):
+                self.breaker.before_call()
+
+    def test_half_open_probe_closes_breaker(self):
+        """Test one probe is let through after the open period and resets the window."""
+        with self.settings(SPOTIFY_BREAKER_OPEN_SECONDS=1, SPOTIFY_BREAKER_STATE_TTL=0):
+            self.breaker._open()
+            cache.delete(self.breaker.open_key)
+            self.assertEqual(self.breaker.state, 'half_open')
+            probe = self.breaker.before_call()
+            self.assertTrue(probe)
+            with self.assertRaises(SpotifyUnavailable):
+                self.breaker.before_call()
+            self.breaker.record_success(probe)
+            self.assertEqual(self.breaker.state, 'closed')
+            self.assertEqual(self.breaker.failure_rate(), (0, 0.0))
+
+    def test_probe_released_when_request_is_never_sent(self):
+        """Test a probe that fails before reaching Spotify doesn't wedge half-open."""
+        service = SpotifyService()
+        with self.settings(SPOTIFY_BREAKER_STATE_TTL=0), \
+                mock.patch('recommendations.spotify_service.spotify_breaker', self.breaker), \
+                mock.patch.object(service, '_get_access_token', return_value='token'), \
+                mock.patch('recommendations.spotify_service.spotify_quota') as quota:
+            self.breaker._open()
+            cache.delete(self.breaker.open_key)
+            quota.acquire.side_effect = SpotifyQuotaExceeded('quota exhausted')
+            with self.assertRaises(SpotifyQuotaExceeded):
+                service._request('GET', 'https://api.spotify.com/v1/tracks')
+            self.assertEqual(self.breaker.state, 'half_open')
+            self.assertTrue(self.breaker.before_call())
+
+    def test_task_serves_stale_recommendations_while_open(self):
+        """Test the task skips Spotify and re-caches stored results."""
+        user = User.objects.create_user(username='stale', password='x')
+        Track.objects.create(id='t1', name='Song')
+        Recommendation.objects.create(
+            user=user, track_id='t1', track_name='Song', artist_name='Artist',
+            spotify_url='https://open.spotify.com/track/t1'
+        )
+        with mock.patch('recommendations.tasks.spotify_breaker') as breaker, \
+                mock.patch('recommendations.tasks.SpotifyService') as service:
+            breaker.is_open.return_value = True
+            result = fetch_user_recommendations(user.id)
+        service.assert_not_called()
+        self.assertEqual(result, {'status': 'stale', 'source': 'database', 'count': 1})
+        self.assertEqual(len(recommendation_cache.cached_recommendations(user.id)), 1)
+
+    def test_task_serves_stale_while_half_open(self):
+        """Test lookups rejected behind another worker's probe are not a success."""
+        user = User.objects.create(username='probe', email='probe@example.com')
+        RecommendationState.mark_dirty(user.id)
+        with mock.patch('recommendations.tasks.spotify_breaker') as breaker, \
+                mock.patch('recommendations.tasks.SpotifyService') as service:
+            breaker.is_open.return_value = False
+            breaker.state = 'half_open'
+            service.return_value.get_shared_recommendations.return_value = {'tracks': []}
+            result = fetch_user_recommendations(user.id)
+        self.assertEqual(result, {'status': 'stale', 'source': 'database', 'count': 0})
+        self.assertIsNotNone(RecommendationState.objects.get(user=user).dirty_since)
+
+
+class TrackCatalogTest(TestCase):
+    """Test the normalized track/artist/album catalog."""
+
+    def payload(self, track_id, popularity=50):
+        return {
+            'id': track_id,
+            'name': f'Song {track_id}',
+            'artists': [{'id': 'a1', 'name': 'Artist', 'external_urls': {'spotify': 'https://open.spotify.com/artist/a1'}}],
+            'album': {
+                'id': 'al1',
+                'name': 'Album',
+                'images': [{'url': 'https://i.scdn.co/image/big'}, {'url': 'https://i.scdn.co/image/small'}],
+                'available_markets': ['US', 'GB'],
+            },
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+            'popularity': popularity,
+        }
+
+    def test_shared_entities_stored_once(self):
+        """Test tracks sharing an album and artist reference single rows."""
+        ids = Track.upsert_from_spotify([self.payload('t1'), self.payload('t2')])
+        self.assertEqual(ids, ['t1', 't2'])
+        self.assertEqual(Album.objects.count(), 1)
+        self.assertEqual(Album.objects.get().image_url, 'https://i.scdn.co/image/big')
+        self.assertEqual(list(Track.objects.get(id='t2').artists.values_list('id', flat=True)), ['a1'])
+
+    def test_upsert_refreshes_existing_rows(self):
+        """Test re-upserting a track updates it in place."""
+        with self.settings(CATALOG_REFRESH_INTERVAL=0):
+            Track.upsert_from_spotify([self.payload('t1', popularity=10)])
+            Track.upsert_from_spotify([self.payload('t1', popularity=90)])
+        self.assertEqual(Track.objects.count(), 1)
+        self.assertEqual(Track.objects.get().popularity, 90)
+
+    def test_serializer_metadata_built_from_catalog(self):
+        """Test recommendations carry their artists and album from the catalog."""
+        Track.upsert_from_spotify([self.payload('t1')])
+        user = User.objects.create(username='meta', email='meta@example.com')
+        Recommendation.objects.create(user=user, track_id='t1', track_name='Song t1', artist_name='Artist', spotify_url='')
+        metadata = RecommendationSerializer(Recommendation.objects.with_catalog().get()).data['metadata']
+        self.assertEqual(metadata['artists'], [
+            {'id': 'a1', 'name': 'Artist', 'external_urls': {'spotify': 'https://open.spotify.com/artist/a1'}}
+        ])
+        self.assertEqual(metadata['album']['id'], 'al1')
+        self.assertEqual(metadata['album']['images'], [{'url': 'https://i.scdn.co/image/big'}])
+
+    def test_recently_refreshed_rows_not_rewritten(self):
+        """Test rows inside CATALOG_REFRESH_INTERVAL are skipped, not updated."""
+        Track.upsert_from_spotify([self.payload('t1', popularity=10)])
+        updated_at = Track.objects.get().updated_at
+        with CaptureQueriesContext(connection) as queries:
+            Track.upsert_from_spotify([self.payload('t1', popularity=90)])
+        self.assertFalse([q for q in queries if q['sql'].startswith('INSERT INTO "recommendations_track" ')])
+        self.assertEqual((Track.objects.get().popularity, Track.objects.get().updated_at), (10, updated_at))
+
+
+class FetchUserRecommendationsTest(TestCase):
+    """Test the persistence path of fetch_user_recommendations."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bulk', email='bulk@example.com', password='x')
+        self.catalog = FakeSpotify().catalog
+
+    def fetch(self, count, limit=20):
+        tracks = [
+            spotify_service.project_track(self.catalog.track(f'{self.user.id}{i:021d}'[-22:]))
+            for i in range(count)
+        ]
+        with mock.patch('recommendations.tasks.spotify_breaker') as breaker, \
+                mock.patch('recommendations.tasks.SpotifyService') as service:
+            breaker.is_open.return_value = False
+            service.return_value.get_shared_recommendations.return_value = {'tracks': tracks}
+            with CaptureQueriesContext(connection) as queries:
+                result = fetch_user_recommendations(self.user.id, limit=limit)
+        return tracks, result, len(queries)
+
+    def test_empty_result_is_retried_and_user_stays_dirty(self):
+        """Test a fetch that returns no tracks does not count as a refresh."""
+        RecommendationState.mark_dirty(self.user.id)
+        with mock.patch('recommendations.tasks.spotify_breaker') as breaker, \
+                mock.patch('recommendations.tasks.SpotifyService') as service, \
+                mock.patch.object(fetch_user_recommendations, 'retry', side_effect=RuntimeError) as retry:
+            breaker.is_open.return_value = False
+            breaker.state = 'closed'
+            service.return_value.get_shared_recommendations.return_value = {'tracks': []}
+            with self.assertRaises(RuntimeError):
+                fetch_user_recommendations(self.user.id)
+        retry.assert_called_once()
+        self.assertIsNotNone(RecommendationState.objects.get(user=self.user).dirty_since)
+        self.assertFalse(self.user.recommendation_logs.filter(status='success').exists())
+
+    def test_query_count_does_not_grow_with_tracks(self):
+        """Test writes are batched rather than one INSERT per track."""
+        self.fetch(1, limit=1)  # First refresh also creates the user's state row
+        _, _, few = self.fetch(2, limit=2)
+        _, result, many = self.fetch(30, limit=30)
+        self.assertEqual(result, {'status': 'success', 'count': 30})
+        self.assertEqual(few, many)
+
+    def test_cache_matches_database_and_prunes_to_100(self):
+        """Test the cache is filled in rank order and old rows are pruned."""
+        self.fetch(50, limit=50)
+        self.fetch(50, limit=50)
+        tracks, _, _ = self.fetch(10, limit=10)
+        self.assertEqual(Recommendation.objects.filter(user=self.user).count(), 100)
+        cached = recommendation_cache.cached_recommendations(self.user.id)
+        self.assertEqual([r['track_id'] for r in cached], [t['id'] for t in tracks])
+        stored = Recommendation.objects.filter(user=self.user).order_by('-created_at')[:10]
+        self.assertEqual(cached, RecommendationSerializer(stored, many=True).data)
+
+
+class RecommendationSweepTest(TestCase):
+    """Test the batched, resumable refresh sweep."""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create(username=f'sweep{i}', email=f'sweep{i}@example.com')
+            for i in range(5)
+        ]
+        patcher = mock.patch.object(fetch_user_recommendations, 'run', return_value={'status': 'success'})
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+        run_tasks_eagerly(self)
+
+    def refreshed_user_ids(self):
+        return sorted(call.args[0] for call in self.fetch.call_args_list)
+
+    def test_sweep_queues_every_user_in_batches(self):
+        """Test all users are refreshed and the sweep reports completion."""
+        with self.settings(RECOMMENDATION_SWEEP_BATCH_SIZE=2, RECOMMENDATION_SWEEP_MAX_IN_FLIGHT=3):
+            result = refresh_all_user_recommendations()
+        self.assertEqual(result['status'], 'started')
+        self.assertEqual(self.refreshed_user_ids(), [user.id for user in self.users])
+        progress = get_sweep_progress()
+        self.assertEqual(progress['status'], 'complete')
+        self.assertEqual((progress['queued'], progress['done'], progress['in_flight']), (5, 5, 0))
+
+    def test_stalled_sweep_resumes_after_cursor(self):
+        """Test an interrupted sweep continues from its last queued user."""
+        cache.set(SWEEP_STATE_KEY, {
+            'sweep_id': 'stalled', 'status': 'running', 'cursor': self.users[2].id,
+            'queued': 3, 'total': 5, 'started_at': time.time() - 3600,
+            'finished_at': None, 'heartbeat': time.time() - 3600,
+        })
+        result = refresh_all_user_recommendations()
+        self.assertEqual(result['status'], 'resumed')
+        self.assertEqual(self.refreshed_user_ids(), [self.users[3].id, self.users[4].id])
+        self.assertEqual(get_sweep_progress()['status'], 'complete')
+
+    def test_batch_seed_artists_are_fetched_together(self):
+        """Test a sweep batch fetches its users' seed artists in one batch call."""
+        shared, other, third = 'a' * 22, 'b' * 22, 'c' * 22
+        for user, artists in zip(self.users, ([shared], [shared, other], [other, third, 'd' * 22])):
+            UserProfile.objects.create(user=user, favorite_artists=artists)
+        with mock.patch.object(SpotifyService, 'get_artists', return_value={}) as get_artists:
+            refresh_all_user_recommendations()
+        get_artists.assert_called_once()
+        self.assertEqual(sorted(get_artists.call_args.args[0]), [shared, other, third])
+
+    def test_running_sweep_is_not_restarted(self):
+        """Test the beat task leaves a live sweep alone."""
+        cache.set(SWEEP_STATE_KEY, {
+            'sweep_id': 'live', 'status': 'running', 'cursor': 0, 'queued': 0,
+            'total': 5, 'started_at': time.time(), 'finished_at': None, 'heartbeat': time.time(),
+        })
+        self.assertEqual(refresh_all_user_recommendations()['status'], 'running')
+        self.fetch.assert_not_called()
+
+
+class DirtyTrackingSweepTest(TestCase):
+    """Test scheduled refreshes only cover users whose inputs changed."""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create(username=f'dirty{i}', email=f'dirty{i}@example.com')
+            for i in range(4)
+        ]
+        patcher = mock.patch.object(fetch_user_recommendations, 'run', return_value={'status': 'success'})
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+        run_tasks_eagerly(self)
+
+    def test_only_dirty_stale_or_new_users_are_refreshed(self):
+        """Test fresh, unchanged users are skipped."""
+        fresh, dirty, stale, new = self.users
+        started_at = timezone.now()
+        for user in (fresh, dirty, stale):
+            RecommendationState.mark_refreshed(user.id, started_at)
+        RecommendationState.objects.filter(user=stale).update(
+            refreshed_at=started_at - timedelta(days=2)
+        )
+        RecommendationState.mark_dirty(dirty.id)
+
+        # One tick spanning the dormant tier's whole interval
+        with self.settings(RECOMMENDATION_SCHEDULER_TICK=86400):
+            result = schedule_recommendation_refreshes()
+        self.assertEqual(result['scheduled']['dormant'], 3)
+        refreshed = sorted(call.args[0] for call in self.fetch.call_args_list)
+        self.assertEqual(refreshed, [dirty.id, stale.id, new.id])
+
+    def test_changes_during_refresh_keep_user_dirty(self):
+        """Test a refresh only clears changes made before it started."""
+        user = self.users[0]
+        started_at = timezone.now()
+        RecommendationState.mark_dirty(user.id)
+        RecommendationState.mark_refreshed(user.id, started_at)
+        self.assertIsNotNone(RecommendationState.objects.get(user=user).dirty_since)
+
+        RecommendationState.mark_refreshed(user.id, timezone.now())
+        self.assertIsNone(RecommendationState.objects.get(user=user).dirty_since)
+
+    def test_preference_update_marks_user_dirty(self):
+        """Test editing preferences flags the user for the next sweep."""
+        user = self.users[0]
+        UserProfile.objects.create(user=user)
+        response = self.client.post(
+            f'/api/users/{user.id}/update_preferences/', {'favorite_genres': ['jazz']},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(RecommendationState.objects.get(user=user).dirty_since)
+
+
+class TieredRefreshSchedulerTest(TestCase):
+    """Test activity-tiered, spread-out refresh scheduling."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(fetch_user_recommendations, 'run', return_value={'status': 'success'})
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+        run_tasks_eagerly(self)
+
+    def make_users(self, prefix, count, last_active_at=None):
+        users = [
+            User.objects.create(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com')
+            for i in range(count)
+        ]
+        if last_active_at:
+            RecommendationState.objects.bulk_create([
+                RecommendationState(user=user, last_active_at=last_active_at) for user in users
+            ])
+        return users
+
+    def scheduled_ids(self):
+        ids = sorted(call.args[0] for call in self.fetch.call_args_list)
+        self.fetch.reset_mock()
+        return ids
+
+    def test_each_tick_queues_a_share_of_each_tier(self):
+        """Test hot users are refreshed faster and spread across ticks."""
+        now = timezone.now()
+        hot = self.make_users('hot', 12, last_active_at=now)
+        self.make_users('warm', 4, last_active_at=now - timedelta(days=3))
+        self.make_users('dormant', 4)
+
+        result = schedule_recommendation_refreshes()
+        # 12 * 300 / 1800, 4 * 300 / 21600 and 4 * 300 / 86400, rounded up
+        self.assertEqual(result['scheduled'], {'hot': 2, 'warm': 1, 'dormant': 1})
+        first_tick = self.scheduled_ids()
+
+        schedule_recommendation_refreshes()
+        second_tick = self.scheduled_ids()
+        self.assertFalse(set(first_tick) & set(second_tick))
+        self.assertEqual(len(set(first_tick + second_tick) & {user.id for user in hot}), 4)
+
+    def test_dirty_users_go_first(self):
+        """Test users with changed inputs are queued before merely stale ones."""
+        users = self.make_users('dormant', 5)
+        RecommendationState.mark_dirty(users[3].id)
+        schedule_recommendation_refreshes()
+        self.assertEqual(self.scheduled_ids(), [users[3].id])
+
+    def test_tick_is_queued_under_the_in_flight_cap(self):
+        """Test a tick's users go out in capped batches and later ticks wait for them."""
+        users = self.make_users('dormant', 5)
+        with self.settings(RECOMMENDATION_SCHEDULER_TICK=86400, RECOMMENDATION_SWEEP_BATCH_SIZE=2,
+                           RECOMMENDATION_SWEEP_MAX_IN_FLIGHT=3):
+            result = schedule_recommendation_refreshes()
+        self.assertEqual(result['scheduled']['dormant'], 5)
+        self.assertEqual(self.scheduled_ids(), [user.id for user in users])
+        progress = get_sweep_progress()
+        self.assertEqual((progress['mode'], progress['status'], progress['done']), ('scheduled', 'complete', 5))
+
+        progress['status'] = 'running'
+        progress['heartbeat'] = time.time()
+        cache.set(SWEEP_STATE_KEY, progress)
+        RecommendationState.mark_dirty(users[0].id)
+        self.assertEqual(schedule_recommendation_refreshes()['status'], 'running')
+        self.fetch.assert_not_called()
+
+    def test_reads_promote_user_to_hot_tier(self):
+        """Test reading recommendations records activity."""
+        user = self.make_users('reader', 1)[0]
+        self.client.get(f'/api/recommendations/user/{user.id}/')
+        self.assertIsNotNone(RecommendationState.objects.get(user=user).last_active_at)
+        self.assertEqual(schedule_recommendation_refreshes()['scheduled']['hot'], 1)
+
+
+class RecommendationCacheRefreshAheadTest(TestCase):
+    """Test refresh-ahead rebuilding of per-user recommendation entries."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='ahead', email='ahead@example.com')
+        Track.objects.create(id='t1', name='Song')
+        Recommendation.objects.create(
+            user=self.user, track_id='t1', track_name='Song', artist_name='Artist',
+            spotify_url='https://open.spotify.com/track/t1'
+        )
+
+    def read_at(self, offset):
+        with mock.patch('recommendations.recommendation_cache.time.time', return_value=self.now + offset):
+            return recommendation_cache.get_recommendations(self.user.id)[0]['count']
+
+    def cache_stored(self, **kwargs):
+        stored = list(Recommendation.objects.filter(user=self.user))
+        recommendation_cache.set_recommendations(self.user.id, stored, **kwargs)
+
+    def test_reads_near_expiry_rebuild_entry_once(self):
+        """Test one rebuild is queued and the next expiry is pushed back."""
+        self.now = time.time()
+        with self.settings(RECOMMENDATION_CACHE_TTL=100, RECOMMENDATION_REFRESH_AHEAD_FACTOR=0.25):
+            with mock.patch('recommendations.recommendation_cache.time.time', return_value=self.now):
+                self.cache_stored()
+            self.assertEqual(self.read_at(10), 1)
+            with mock.patch('recommendations.tasks.warm_user_recommendations.delay') as warm:
+                self.read_at(80)
+                self.read_at(85)
+            warm.assert_called_once_with(self.user.id, mock.ANY)
+
+    def test_saved_misses_reported_in_stats(self):
+        """Test hits after the replaced expiry count as misses avoided."""
+        self.now = time.time()
+        self.cache_stored(replaces_expiry=self.now + 5)
+        self.read_at(0)
+        self.read_at(10)
+        self.read_at(20)
+        value, source = recommendation_cache.get_recommendations(0)
+        self.assertEqual((value['count'], value['json'], source), (0, b'[]', 'database'))
+
+        stats = recommendation_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['saved_misses']), (3, 1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.75)
+        self.assertEqual(stats['hit_ratio_without_refresh_ahead'], 0.5)
+
+    def test_warm_task_rebuilds_from_database(self):
+        """Test the rebuilt entry holds the stored recommendations."""
+        from .tasks import warm_user_recommendations
+        warm_user_recommendations(self.user.id, time.time())
+        self.assertEqual(recommendation_cache.get_recommendations(self.user.id)[1], 'cache')
+        cached = recommendation_cache.cached_recommendations(self.user.id)
+        self.assertEqual([r['track_id'] for r in cached], ['t1'])
+
+
+class PreEncodedRecommendationsTest(TestCase):
+    """Test recommendation reads are served from pre-encoded JSON."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='encoded', email='encoded@example.com')
+        Track.objects.create(id='t1', name='Song')
+        Recommendation.objects.create(
+            user=self.user, track_id='t1', track_name='Sõng', artist_name='Artist',
+            spotify_url='https://open.spotify.com/track/t1'
+        )
+
+    def test_hit_is_served_without_serializing(self):
+        """Test a cached read neither serializes nor re-encodes."""
+        url = f'/api/recommendations/user/{self.user.id}/'
+        first = self.client.get(url)
+        with mock.patch('recommendations.recommendation_cache.RecommendationSerializer') as serializer, \
+                mock.patch('recommendations.recommendation_cache.dumps', wraps=recommendation_cache.dumps) as dumps:
+            second = self.client.get(url)
+        serializer.assert_not_called()
+        self.assertEqual(dumps.call_count, 1)  # The small header only
+
+        self.assertEqual(second['Content-Type'], 'application/json')
+        body = json.loads(second.content)
+        self.assertEqual((body['user_id'], body['source'], body['count']), (self.user.id, 'cache', 1))
+        self.assertEqual(json.loads(first.content)['recommendations'], body['recommendations'])
+        self.assertEqual(body['recommendations'][0]['track_name'], 'Sõng')
+
+    def test_hit_runs_no_queries(self):
+        """Test warm reads and repeated unknown IDs run no SQL."""
+        url = f'/api/recommendations/user/{self.user.id}/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(json.loads(response.content)['source'], 'cache')
+
+        self.client.get('/api/recommendations/user/999999/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/recommendations/user/999999/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        """Test a matching If-None-Match gets a 304 until the entry changes."""
+        url = f'/api/recommendations/user/{self.user.id}/'
+        self.client.get(url)
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        Recommendation.objects.filter(user=self.user).update(track_name='Other')
+        recommendation_cache.set_recommendations(self.user.id, Recommendation.objects.filter(user=self.user))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_task_and_view_cache_the_same_shape(self):
+        """Test entries written by the task match ones built by reads."""
+        built = recommendation_cache.build_recommendations(self.user.id)
+        with mock.patch('recommendations.tasks.spotify_breaker') as breaker:
+            breaker.is_open.return_value = True
+            fetch_user_recommendations(self.user.id)
+        self.assertEqual(caching.read_entry(recommendation_cache.cache_key(self.user.id))['value'], built)
+
+
+class RecommendationCursorPaginationTest(TestCase):
+    """Test keyset pagination of the recommendation listing."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='pager', email='pager@example.com')
+        other = User.objects.create(username='other', email='other@example.com')
+        Track.objects.create(id='t1', name='Song')
+        Recommendation.objects.bulk_create([
+            Recommendation(user=user, track_id='t1', track_name='Song', artist_name='Artist', spotify_url='')
+            for user in [self.user] * 25 + [other] * 5
+        ])
+
+    def test_user_listing_pages_without_count(self):
+        """Test ?user= pages through one user's recommendations by cursor."""
+        url, ids = f'/api/recommendations/list/?user={self.user.id}', []
+        while url:
+            with self.assertNumQueries(2):  # Rows with track and album, then artists
+                body = self.client.get(url).json()
+            self.assertNotIn('count', body)
+            ids.extend(item['id'] for item in body['results'])
+            url = body['next']
+        self.assertEqual(ids, list(Recommendation.objects.filter(user=self.user).values_list('id', flat=True)))
+
+    def test_sparse_fields_project_columns(self):
+        """Test ?fields= selects only the requested columns."""
+        url = f'/api/recommendations/list/?user={self.user.id}&fields=id,track_id,track_name,album_art_url'
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get(url).json()
+        self.assertEqual(list(body['results'][0]), ['id', 'track_id', 'track_name', 'album_art_url'])
+        self.assertNotIn('metadata', queries[0]['sql'])
+
+        response = self.client.get('/api/recommendations/list/?exclude=metadata,bogus')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bogus', response.json()['exclude'][0])
+
+
+class ORJSONRendererTest(TestCase):
+    """Test the orjson renderer matches DRF's JSONRenderer output."""
+
+    def test_output_matches_json_renderer(self):
+        """Test types orjson lacks fall back to DRF's formatting."""
+        data = {
+            'name': 'Björk',
+            'price': Decimal('1.50'),
+            'at': timezone.now(),
+            'label': gettext_lazy('User not found'),
+            1: [None, True, 2.5],
+        }
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render(data)),
+            json.loads(JSONRenderer().render(data))
+        )
+
+    def test_indent_request_uses_stock_renderer(self):
+        """Test indented output is still available."""
+        content = ORJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(content, b'{\n  "a": 1\n}')
+
+
+class StampedeProtectionTest(TestCase):
+    """Test single-rebuild, serve-stale cache reads."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_expired_entry_served_stale_while_rebuilt(self):
+        """Test only the lock holder rebuilds; others get the old value."""
+        caching.write_entry('stampede', 'old', ttl=-1)
+        cache.add('stampede:rebuild_lock', 1, 10)
+        build = mock.Mock(return_value='new')
+        self.assertEqual(caching.get_or_build('stampede', build, 60)[:2], ('old', caching.STALE))
+        build.assert_not_called()
+
+        cache.delete('stampede:rebuild_lock')
+        self.assertEqual(caching.get_or_build('stampede', build, 60)[:2], ('new', caching.BUILT))
+        self.assertEqual(caching.get_or_build('stampede', build, 60)[:2], ('new', caching.FRESH))
+        build.assert_called_once()
+
+    def test_concurrent_misses_build_once(self):
+        """Test simultaneous first reads share one build."""
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(caching.get_or_build('cold', build, 60)[0]))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
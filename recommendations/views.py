@@ -4,34 +4,39 @@ Views for recommendations app.
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
-from django.core.cache import cache
-from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
-from .models import Recommendation, RecommendationLog
+from music_discovery_backend.pagination import UserScopedListMixin
+from music_discovery_backend.sparse_fields import SparseFieldsMixin
+from .models import Recommendation, RecommendationLog, RecommendationState
 from .serializers import (
     RecommendationSerializer, 
     RecommendationLogSerializer,
     RefreshRecommendationsSerializer
 )
+from . import recommendation_cache
 from .tasks import fetch_user_recommendations
-from users.models import User
+from .spotify_quota import INTERACTIVE
+from users.existence import user_exists
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 @method_decorator(ratelimit(key='ip', rate='30/m'), name='list')
-class RecommendationViewSet(viewsets.ReadOnlyModelViewSet):
+class RecommendationViewSet(SparseFieldsMixin, UserScopedListMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for viewing recommendations.
     
     Endpoints:
-    - GET /recommendations/ - List all recommendations
+    - GET /recommendations/ - List all recommendations (?user=<id> for one user's)
     - GET /recommendations/{id}/ - Get specific recommendation
     """
     serializer_class = RecommendationSerializer
-    queryset = Recommendation.objects.all()
+    queryset = Recommendation.objects.with_catalog()
+    newest_first = 'created_at'
 
 
 @api_view(['GET'])
@@ -41,40 +46,38 @@ def get_user_recommendations(request, user_id):
     GET /recommendations/{user_id}/
     
     Retrieve cached recommendations for a user.
+    
+    Responses carry a strong ETag of the cached entry and honour
+    If-None-Match, so polling clients get a 304 until it is rebuilt.
     """
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
+    # Cached existence check: a cache hit is served without any SQL
+    if not user_exists(user_id):
         return Response(
             {'error': 'User not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Try to get from cache first
-    cache_key = f'user_recommendations_{user_id}'
-    cached_recommendations = cache.get(cache_key)
-    
-    if cached_recommendations:
-        return Response({
-            'user_id': user_id,
-            'source': 'cache',
-            'count': len(cached_recommendations),
-            'recommendations': cached_recommendations
-        })
-    
-    # If not in cache, get from database
-    recommendations = Recommendation.objects.filter(user=user).order_by('-created_at')[:20]
-    serializer = RecommendationSerializer(recommendations, many=True)
+    RecommendationState.mark_active(user_id)
     
-    # Cache the results
-    cache.set(cache_key, serializer.data, settings.RECOMMENDATION_CACHE_TTL)
+    # Served from cache; a miss or expired entry is rebuilt by one request
+    # while concurrent ones get the stale copy
+    cached, source = recommendation_cache.get_recommendations(user_id)
+    if source == 'database':
+        # Expired for a user who is reading them: refresh in the next sweep
+        RecommendationState.mark_dirty(user_id)
     
-    return Response({
-        'user_id': user_id,
-        'source': 'database',
-        'count': len(serializer.data),
-        'recommendations': serializer.data
-    })
+    # Pollers whose copy is current get a 304; everyone else gets the cached
+    # JSON as-is rather than through a renderer
+    etag = recommendation_cache.response_etag(source, cached)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(
+            recommendation_cache.response_body(user_id, source, cached),
+            content_type='application/json'
+        )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @api_view(['POST'])
@@ -85,9 +88,7 @@ def refresh_user_recommendations(request, user_id):
     
     Trigger asynchronous refresh of user recommendations.
     """
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
+    if not user_exists(user_id):
         return Response(
             {'error': 'User not found'}, 
             status=status.HTTP_404_NOT_FOUND
@@ -106,7 +107,8 @@ def refresh_user_recommendations(request, user_id):
         user_id=user_id,
         limit=limit,
         seed_genres=seed_genres,
-        seed_artists=seed_artists
+        seed_artists=seed_artists,
+        priority=INTERACTIVE
     )
     
     return Response({
@@ -0,0 +1,30 @@
+"""
+Cached user-existence checks for hot read paths.
+
+Views that only need to know whether a user ID is valid ask user_exists()
+instead of loading the User. Answers are cached per ID, known users for
+USER_EXISTENCE_TTL and unknown IDs for USER_EXISTENCE_NEGATIVE_TTL, and
+users.signals rewrites the entry when a user is created or deleted, so a
+cached answer never outlives the change that invalidates it.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from .models import User
+
+
+def cache_key(user_id):
+    return f'user_exists_{user_id}'
+
+
+def remember(user_id, exists):
+    ttl = settings.USER_EXISTENCE_TTL if exists else settings.USER_EXISTENCE_NEGATIVE_TTL
+    cache.set(cache_key(user_id), exists, ttl)
+
+
+def user_exists(user_id):
+    """Whether a user with this ID exists; queries the database only on a miss."""
+    exists = cache.get(cache_key(user_id))
+    if exists is None:
+        exists = User.objects.filter(id=user_id).exists()
+        remember(user_id, exists)
+    return exists
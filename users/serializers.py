@@ -3,6 +3,7 @@ Serializers for users app.
 """
 from rest_framework import serializers
 from .models import User, UserProfile
+from recommendations.models import RecommendationState
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -77,6 +78,7 @@ class UserSerializer(serializers.ModelSerializer):
             for attr, value in profile_data.items():
                 setattr(profile, attr, value)
             profile.save()
+            RecommendationState.mark_dirty(instance.id)
         
         return instance
 
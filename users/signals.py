@@ -0,0 +1,21 @@
+"""
+Signal handlers for users app.
+"""
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import existence
+from .models import User
+
+
+@receiver(post_save, sender=User)
+def remember_created_user(sender, instance, created, **kwargs):
+    # After commit, so a rolled-back create never reads as existing
+    if created:
+        transaction.on_commit(partial(existence.remember, instance.pk, True))
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    transaction.on_commit(partial(existence.remember, instance.pk, False))
@@ -1,9 +1,11 @@
 """
 Tests for users app.
 """
+from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
+from .existence import user_exists
 from .models import User, UserProfile
 
 
@@ -33,6 +35,33 @@ class UserModelTest(TestCase):
         self.assertEqual(len(self.user.profile.favorite_genres), 2)
 
 
+class UserExistenceTest(TestCase):
+    """Test the cached user-existence check."""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_unknown_id_queried_once(self):
+        """Test unknown IDs are rejected from cache after the first lookup."""
+        with self.assertNumQueries(1):
+            self.assertFalse(user_exists(999))
+        with self.assertNumQueries(0):
+            self.assertFalse(user_exists(999))
+    
+    def test_create_and_delete_update_cache(self):
+        """Test signals keep cached answers current without queries."""
+        self.assertFalse(user_exists(1))
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(id=1, username='exists', email='exists@example.com')
+        with self.assertNumQueries(0):
+            self.assertTrue(user_exists(user.id))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        with self.assertNumQueries(0):
+            self.assertFalse(user_exists(1))
+
+
 class UserAPITest(APITestCase):
     """Test User API endpoints."""
     
@@ -64,3 +93,19 @@ class UserAPITest(APITestCase):
         response = self.client.get(f'/api/users/{user.id}/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['email'], 'test@example.com')
+
+    def test_list_users_with_sparse_fields(self):
+        """Test nested fields are still served when explicitly requested."""
+        user = User.objects.create(username='sparse', email='sparse@example.com')
+        UserProfile.objects.create(user=user, favorite_genres=['jazz'])
+        
+        response = self.client.get('/api/users/?fields=id,email')
+        self.assertEqual(response.data['results'], [{'id': user.id, 'email': 'sparse@example.com'}])
+        
+        response = self.client.get('/api/users/?fields=id,profile')
+        self.assertEqual(response.data['results'][0]['profile']['favorite_genres'], ['jazz'])
+        self.assertEqual(set(response.data['results'][0]), {'id', 'profile'})
+        
+        for query in ('fields=', 'fields=,'):
+            response = self.client.get(f'/api/users/?{query}')
+            self.assertEqual(response.status_code, 400)
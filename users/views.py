@@ -6,12 +6,14 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
+from music_discovery_backend.sparse_fields import SparseFieldsMixin
 from .models import User, UserProfile
 from .serializers import UserSerializer, UserCreateSerializer
+from recommendations.models import RecommendationState
 
 
 @method_decorator(ratelimit(key='ip', rate='10/m', method='POST'), name='create')
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     ViewSet for User CRUD operations.
     
@@ -21,7 +23,7 @@ class UserViewSet(viewsets.ModelViewSet):
     - PUT /users/{id}/ - Update user profile
     - DELETE /users/{id}/ - Delete user
     """
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('id')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -83,6 +85,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 profile.preferences = request.data['preferences']
             
             profile.save()
+            RecommendationState.mark_dirty(user.id)
             
             return Response({
                 'message': 'Preferences updated successfully',